@@ -1,3 +1,15 @@
 from .client import ALFACRM  # Используем относительный импорт
+from .async_client import AsyncALFACRM
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .auth import TokenCache
+from .refcache import ReferenceCache
+from .cache import ResponseCache
+from .replica import SQLiteReplica
+from .changes import ChangeEvent, ChangeFeed
+from .lookup import CustomerIndex
+from .bulk import BulkResult
+from .registry import ClientRegistry
+from .hooks import RequestEvent, RequestHooks
 
-__all__ = ['ALFACRM']
+__all__ = ['ALFACRM', 'AsyncALFACRM', 'RateLimiter', 'RetryPolicy', 'TokenCache', 'ReferenceCache', 'ResponseCache', 'SQLiteReplica', 'ChangeEvent', 'ChangeFeed', 'CustomerIndex', 'BulkResult', 'ClientRegistry', 'RequestEvent', 'RequestHooks']
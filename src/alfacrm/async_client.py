@@ -0,0 +1,575 @@
+# async_client.py
+import asyncio
+from collections import deque
+from itertools import islice
+from time import perf_counter
+from typing import Dict, Optional, AsyncIterator, Callable, Awaitable, Iterable, List, Any, Tuple, Union
+from datetime import datetime, timedelta
+from .client import ALFACRM
+from .exceptions import *
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .auth import TokenCache
+from .cache import ResponseCache
+from .bulk import BulkResult
+from .records import RecordTable
+from .columns import ColumnBuilder, require_numpy, require_arrow
+from .hooks import HttpxTrace
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx ставится через extra [async]
+    httpx = None
+
+
+class AsyncALFACRM(ALFACRM):
+    """Асинхронный клиент API ALFA CRM на базе httpx"""
+
+    def __init__(
+            self,
+            hostname: str,
+            email: str,
+            api_key: str,
+            client: Optional['httpx.AsyncClient'] = None,
+            max_connections: int = 10,
+            max_keepalive_connections: int = 10,
+            keepalive_expiry: Optional[float] = 5.0,
+            max_workers: int = 4,
+            rate_limiter: Optional[RateLimiter] = None,
+            rate_limit: Optional[float] = None,
+            max_rate_limit_retries: int = 5,
+            rate_limit_backoff: float = 1.0,
+            retry_policy: Optional[RetryPolicy] = None,
+            timeout: Optional[float] = 60.0,
+            token_cache: Union[TokenCache, str, None] = None,
+            token_refresh_margin: float = 300.0,
+            codec: Optional[Any] = None,
+            response_cache: Optional[ResponseCache] = None
+    ):
+        if httpx is None:
+            raise ImportError("AsyncALFACRM требует httpx: pip install alfacrm[async]")
+
+        self._init_common(
+            hostname, email, api_key,
+            max_workers=max_workers,
+            rate_limiter=rate_limiter,
+            rate_limit=rate_limit,
+            max_rate_limit_retries=max_rate_limit_retries,
+            rate_limit_backoff=rate_limit_backoff,
+            retry_policy=retry_policy,
+            timeout=timeout,
+            token_cache=token_cache,
+            token_refresh_margin=token_refresh_margin,
+            codec=codec,
+            response_cache=response_cache
+        )
+
+        self._owns_session = client is None
+        self.session = client or httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ))
+        self._auth_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Future] = None
+
+        self._init_entities()
+
+        # ReferenceCache обновляет справочники в фоновых потоках и работает только с синхронным клиентом
+        self.reference = None
+        self.write_buffer = None
+
+    def __enter__(self):
+        raise TypeError("AsyncALFACRM закрывается асинхронно: используйте async with")
+
+    def __exit__(self, *exc_info):
+        raise TypeError("AsyncALFACRM закрывается асинхронно: используйте async with")
+
+    async def __aenter__(self) -> 'AsyncALFACRM':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._owns_session:
+            await self.session.aclose()
+
+    class Entity(ALFACRM.Entity):
+        """Асинхронный обработчик сущностей: те же модели и правила построения URL"""
+
+        async def index(self, *, records: str = 'dict', **params) -> Dict:
+            """
+            Получение списка сущностей с фильтрацией.
+            records='model' возвращает записи как экземпляры response_model,
+            records='lazy' - как LazyRecord с проверкой полей при обращении,
+            records='compact' - одной RecordTable с общей схемой ключей
+            """
+            validated_params = self._validate_filter(params)
+
+            cache = self.parent.response_cache
+            if cache is None:
+                return await self._fetch_index(validated_params, records)
+
+            key = self._cache_key(validated_params)
+            response = cache.get(key)
+            if response is None:
+                generation = cache.generation(key)
+                response = await self._fetch_index(validated_params)
+                cache.put(key, response, generation)
+            return self._convert_page(response, records)
+
+        async def _fetch_index(self, params: Dict, records: str = 'dict') -> Dict:
+            if 'page' not in params:
+                return await self._paginated_request(params, records)
+            response = await self.parent._request(
+                'POST', self._build_url('index'), data=params, action='index', entity=self
+            )
+            return self._convert_page(response, records)
+
+        async def create(self, **data) -> Dict:
+            """Создание новой сущности"""
+            validated = self._validate(self.create_model, data) if self.create_model else data
+
+            result = await self.parent._request('POST', self._build_url('create'), data=validated, action='create', entity=self)
+            self.parent._after_write(self)
+            return result
+
+        async def create_many(self, records: Iterable[Dict], max_workers: int = None) -> List[BulkResult]:
+            """Пакетное создание (см. ALFACRM.Entity.create_many)"""
+            results, jobs = self._validate_many(records)
+
+            async def send(job):
+                index, validated = job
+                try:
+                    response = await self.parent._request(
+                        'POST', self._build_url('create'), data=validated, action='create', entity=self
+                    )
+                except APIClientError as e:
+                    return BulkResult(index, error=e)
+                return BulkResult(index, response=response)
+
+            async for result in self.parent._imap_concurrent(send, jobs, max_workers):
+                results[result.index] = result
+            if any(result.ok for result in results):
+                self.parent._after_write(self)
+            return results
+
+        async def update(self, entity_id: int, **data) -> Dict:
+            """Обновление существующей сущности"""
+            validated = self._validate(self.update_model, data) if self.update_model else data
+            return await self._send_update(entity_id, validated)
+
+        async def _send_update(self, entity_id: int, validated: Dict) -> Dict:
+            result = await self.parent._request(
+                'POST', self._build_url('update', id=entity_id), data=validated, action='update', entity=self
+            )
+            self.parent._after_write(self)
+            return result
+
+        async def update_diff(self, entity_id: int, current: Any, **data) -> Optional[Dict]:
+            """Обновление только измененных полей (см. ALFACRM.Entity.update_diff)"""
+            changed = self._diff(current, data)
+            if not changed:
+                self.parent.update_stats.record_skipped()
+                return None
+            self.parent.update_stats.record_sent(len(changed))
+            return await self._send_update(entity_id, changed)
+
+        async def delete(self, entity_id: int, **params) -> Dict:
+            """Удаление сущности"""
+            result = await self.parent._request(
+                'POST', self._build_url('delete', **params, id=entity_id), action='delete', entity=self
+            )
+            self.parent._after_write(self)
+            return result
+
+        async def iter_pages(self, *, records: str = 'dict', **params) -> AsyncIterator[Dict]:
+            """Постраничный обход результатов: страницы отдаются по мере получения"""
+            validated_params = self._validate_filter(params)
+            async for response in self._iter_pages(validated_params):
+                yield self._convert_page(response, records)
+
+        async def iter_items(self, *, records: str = 'dict', **params) -> AsyncIterator:
+            """Обход всех записей без накопления списка в памяти"""
+            async for response in self.iter_pages(records=records, **params):
+                for item in response.get('items', []):
+                    yield item
+
+        async def first(self, *, records: str = 'dict', **params) -> Optional[Any]:
+            """Первая запись, удовлетворяющая фильтру (один запрос)"""
+            items = await self.take(1, records=records, **params)
+            return items[0] if items else None
+
+        async def exists(self, **params) -> bool:
+            """Есть ли хотя бы одна запись, удовлетворяющая фильтру"""
+            return await self.first(**params) is not None
+
+        async def take(self, n: int, *, records: str = 'dict', **params) -> List:
+            """Не больше n записей: запрашиваются только нужные страницы"""
+            items = []
+            if n <= 0:
+                return items
+
+            pages = self._iter_pages(self._validate_filter(params), limit=n)
+            try:
+                async for response in pages:
+                    items.extend(response.get('items', [])[:n - len(items)])
+                    if len(items) >= n:
+                        break
+            finally:
+                await pages.aclose()
+            return self._convert_items(items, records)
+
+        async def count(self, **params) -> int:
+            """Количество записей по фильтру: читается только total первой страницы"""
+            validated_params = self._validate_filter(params)
+            response = await self._request_page(validated_params, validated_params.get('page', 0))
+            return response.get('total', 0)
+
+        async def counts(self, queries: Dict[Any, Dict], max_workers: int = None) -> Dict[Any, int]:
+            """Конкурентный подсчет для набора фильтров"""
+            keys = list(queries)
+            totals = await self.parent._map_concurrent(lambda key: self.count(**queries[key]), keys, max_workers)
+            return dict(zip(keys, totals))
+
+        async def index_all_branches(
+                self,
+                branch_ids: Iterable[int] = None,
+                *,
+                records: str = 'dict',
+                max_workers: int = None,
+                **params
+        ) -> Dict:
+            """Один и тот же запрос по нескольким филиалам (см. ALFACRM.Entity.index_all_branches)"""
+            items, totals = [], {}
+            async for branch_id, pages in self._branch_pages(branch_ids, max_workers, params):
+                totals[branch_id] = 0
+                async for response in pages:
+                    page_items = response.get('items', [])
+                    totals[branch_id] += len(page_items)
+                    items.extend((branch_id, item) for item in self._convert_items(page_items, records))
+            return {'items': items, 'total': sum(totals.values()), 'totals': totals}
+
+        async def iter_all_branches(
+                self,
+                branch_ids: Iterable[int] = None,
+                *,
+                records: str = 'dict',
+                max_workers: int = None,
+                **params
+        ) -> AsyncIterator[Tuple[int, Any]]:
+            """Пары (branch_id, запись) по всем филиалам (см. ALFACRM.Entity.iter_all_branches)"""
+            async for branch_id, pages in self._branch_pages(branch_ids, max_workers, params):
+                async for response in pages:
+                    for item in self._convert_items(response.get('items', []), records):
+                        yield branch_id, item
+
+        async def _branch_pages(
+                self,
+                branch_ids: Optional[Iterable[int]],
+                max_workers: int,
+                params: Dict
+        ) -> AsyncIterator[Tuple[int, AsyncIterator[Dict]]]:
+            if not self.branch_required:
+                raise ValueError(f"Сущность {self.entity_name} не привязана к филиалу")
+            branch_ids = list(branch_ids) if branch_ids is not None else await self.parent._branch_ids()
+            validated_params = self._validate_filter(params)
+            first_page = validated_params.get('page', 0)
+            responses = self.parent._imap_concurrent(
+                lambda branch_id: self.for_branch(branch_id)._request_page(validated_params, first_page),
+                branch_ids,
+                max_workers
+            )
+            try:
+                position = 0
+                async for response in responses:
+                    pages = self.for_branch(branch_ids[position])._iter_pages(validated_params, first=response)
+                    try:
+                        yield branch_ids[position], pages
+                    finally:
+                        await pages.aclose()
+                    position += 1
+            finally:
+                await responses.aclose()
+
+        async def to_columns(self, fields: List[str] = None, date_fields: List[str] = None, **params) -> Dict[str, Any]:
+            """Выгрузка в колонки numpy (см. ALFACRM.Entity.to_columns)"""
+            require_numpy()
+            return (await self._build_columns(fields, date_fields, params)).to_numpy()
+
+        async def to_arrow(self, fields: List[str] = None, date_fields: List[str] = None, **params):
+            """Выгрузка в pyarrow.Table"""
+            require_arrow()
+            return (await self._build_columns(fields, date_fields, params)).to_arrow()
+
+        async def to_parquet(self, path: str, fields: List[str] = None, date_fields: List[str] = None, **params):
+            """Выгрузка в файл Parquet"""
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(await self.to_arrow(fields, date_fields, **params), path)
+
+        async def _build_columns(self, fields: Optional[List[str]], date_fields: Optional[List[str]], params: Dict):
+            builder = ColumnBuilder(self.response_model, fields, date_fields)
+            async for response in self.iter_pages(**params):
+                builder.add_items(response.get('items', []))
+            return builder
+
+        async def _iter_pages(self, params: Dict, limit: int = None, first: Dict = None) -> AsyncIterator[Dict]:
+            """
+            Первая страница дает total, остальные запрашиваются конкурентно и отдаются по порядку.
+            limit ограничивает число запрашиваемых страниц нужным количеством записей,
+            first - уже полученная первая страница
+            """
+            first_page = params.get('page', 0)
+            response = first if first is not None else await self._request_page(params, first_page)
+            page_size = len(response.get('items', []))
+            if not page_size:
+                return
+
+            pages = self._remaining_pages(first_page, page_size, response.get('total', 0), limit)
+            yield response
+
+            responses = self.parent._imap_concurrent(lambda page: self._request_page(params, page), pages)
+            try:
+                async for response in responses:
+                    if response.get('items'):
+                        yield response
+            finally:
+                await responses.aclose()
+
+        async def _request_page(self, params: Dict, page: int) -> Dict:
+            """Запрос одной страницы списка"""
+            return await self.parent._request(
+                'POST', self._build_url('index'), data={**params, 'page': page}, action='index', entity=self
+            )
+
+        async def _paginated_request(self, params: Dict, records: str = 'dict') -> Dict:
+            """Автоматическая обработка пагинации"""
+            all_items = RecordTable() if records == 'compact' else []
+            async for response in self._iter_pages(params):
+                items = response.get('items', [])
+                all_items.extend(items if records == 'compact' else self._convert_items(items, records))
+
+            return {'items': all_items, 'total': len(all_items)}
+
+    async def _branch_ids(self) -> List[int]:
+        """id всех филиалов"""
+        return [branch['id'] async for branch in self.branch.iter_items()]
+
+    async def _imap_concurrent(
+            self,
+            fn: Callable[[Any], Awaitable],
+            items: Iterable,
+            max_workers: int = None
+    ) -> AsyncIterator:
+        """
+        Ленивое конкурентное выполнение fn над items: в работе не больше max_workers задач,
+        результаты отдаются в исходном порядке. При досрочной остановке оставшиеся задачи отменяются
+        """
+        items = iter(items)
+        window = max_workers or self.max_workers
+        pending = deque()
+        try:
+            for item in islice(items, window):
+                pending.append(asyncio.ensure_future(fn(item)))
+            while pending:
+                result = await pending.popleft()
+                for item in islice(items, 1):
+                    pending.append(asyncio.ensure_future(fn(item)))
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _map_concurrent(
+            self,
+            fn: Callable[[Any], Awaitable],
+            items: Iterable,
+            max_workers: int = None
+    ) -> List:
+        """Конкурентное выполнение fn над items (не более max_workers одновременно), порядок результатов сохраняется"""
+        semaphore = asyncio.Semaphore(max_workers or self.max_workers)
+
+        async def run(item):
+            async with semaphore:
+                return await fn(item)
+
+        return list(await asyncio.gather(*(run(item) for item in items)))
+
+    async def _request(
+            self,
+            method: str,
+            url: str,
+            data: Dict = None,
+            action: str = None,
+            entity: 'AsyncALFACRM.Entity' = None
+    ) -> Dict:
+        """
+        Базовый метод для выполнения запросов.
+        Ответ 429 не прерывает работу: запрос повторяется после паузы из Retry-After.
+        Временные сбои повторяются по retry_policy с учетом идемпотентности action,
+        на 401 запрос повторяется один раз с новым токеном
+        """
+        token = await self._ensure_token()
+        body = self.codec.dumps(data) if data is not None else None
+        attempt = 0
+        throttled = 0
+        replayed = False
+        tries = 0
+        while True:
+            headers = {
+                'X-ALFACRM-TOKEN': token,
+                'Content-Type': 'application/json'
+            }
+
+            await self._throttle()
+            self.retry_stats.record_request()
+            event = self._request_event(method, url, data, body, action, entity, tries)
+            tries += 1
+            # Этапы запроса (соединение, ожидание, загрузка) httpx отдает через расширение trace
+            trace = HttpxTrace() if event is not None else None
+            started = perf_counter()
+            try:
+                response = await self.session.request(
+                    method=method,
+                    url=url,
+                    content=body,
+                    headers=headers,
+                    timeout=self.timeout,
+                    extensions={'trace': trace} if trace is not None else None
+                )
+            except httpx.HTTPError as e:
+                # Если соединение не установлено, запрос точно не дошел до сервера
+                if self.retry_policy.should_retry(action, attempt, safe=isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))):
+                    self._emit('on_retry', event, reason=type(e).__name__, error=e, elapsed=perf_counter() - started)
+                    await self._retry_pause(type(e).__name__, attempt)
+                    attempt += 1
+                    continue
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason=type(e).__name__, error=e, elapsed=perf_counter() - started)
+                raise APIRequestError(f"Request failed: {str(e)}", status_code=None) from e
+
+            if event is not None:
+                finished = perf_counter()
+                self._emit(
+                    'after_response', event, status_code=response.status_code, bytes_received=len(response.content),
+                    elapsed=finished - started, **trace.timings(finished)
+                )
+
+            if response.status_code == 401 and not replayed:
+                replayed = True
+                self._emit('on_retry', event, reason='HTTP 401')
+                token = await self._refresh_token(token)
+                continue
+
+            if response.status_code == 429 and throttled < self.max_rate_limit_retries:
+                self.retry_stats.record_rate_limited()
+                self._emit('on_retry', event, reason='HTTP 429')
+                await self._backoff_rate_limited(response, throttled)
+                throttled += 1
+                continue
+
+            if response.status_code in self.retry_policy.retry_statuses \
+                    and self.retry_policy.should_retry(action, attempt):
+                self._emit('on_retry', event, reason=f"HTTP {response.status_code}")
+                await self._retry_pause(f"HTTP {response.status_code}", attempt)
+                attempt += 1
+                continue
+
+            try:
+                response.raise_for_status()
+                return self.codec.loads(response.content)
+            except httpx.HTTPStatusError as e:
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason=f"HTTP {response.status_code}", error=e)
+                self._handle_http_error(e, response)
+            except ValueError as e:
+                # Успешный статус, но тело ответа - не JSON (страница ошибки прокси и т.п.)
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason='Invalid JSON', error=e)
+                raise APIRequestError(f"Invalid JSON in response: {e}", status_code=response.status_code) from e
+
+    async def _retry_pause(self, reason: str, attempt: int):
+        """Учет повтора и пауза перед ним"""
+        self.retry_stats.record_retry(reason)
+        await asyncio.sleep(self.retry_policy.backoff(attempt))
+
+    async def _throttle(self):
+        """Ожидание очереди в ограничителе частоты запросов без блокировки event loop"""
+        if self.rate_limiter:
+            delay = self.rate_limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _backoff_rate_limited(self, response, attempt: int):
+        """Пауза после 429; общий ограничитель притормаживает сразу все задачи"""
+        delay = self._rate_limit_delay(response, attempt)
+        if self.rate_limiter:
+            self.rate_limiter.penalize(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    async def _ensure_token(self) -> str:
+        """Действующий токен: одно обновление на все задачи, заранее в фоне перед истечением"""
+        if self._token_valid():
+            if self._token_expiring():
+                self._schedule_token_refresh()
+            return self.token
+
+        async with self._auth_lock:
+            if not self._token_valid() and not self._load_cached_token():
+                await self.authenticate()
+            return self.token
+
+    async def _refresh_token(self, stale_token: str) -> str:
+        """Замена токена stale_token на новый; если другая задача уже обновила токен, повторного входа нет"""
+        async with self._auth_lock:
+            if self.token == stale_token:
+                if self.token_cache:
+                    self.token_cache.invalidate(self.hostname, self.email, stale_token)
+                await self.authenticate()
+            return self.token
+
+    def _schedule_token_refresh(self):
+        """Фоновое обновление токена, не более одного одновременно"""
+        if self._refresh_task and not self._refresh_task.done():
+            return
+
+        async def refresh(stale_token: str):
+            try:
+                await self._refresh_token(stale_token)
+            except APIClientError:
+                # Не страшно: после истечения токен будет обновлен синхронно
+                pass
+
+        self._refresh_task = asyncio.ensure_future(refresh(self.token))
+
+    async def authenticate(self):
+        """Аутентификация и получение нового токена"""
+        url = f"https://{self.hostname}/v2api/auth/login"
+
+        await self._throttle()
+        try:
+            response = await self.session.post(url, json={
+                "email": self.email,
+                "api_key": self.api_key
+            }, timeout=self.timeout)
+            response.raise_for_status()
+
+            auth_data = response.json()
+            self.token = auth_data.get('token')
+            if not self.token:
+                raise AuthenticationError("No token in response")
+
+            # Токен действителен 3600 секунд (1 час)
+            self.token_expires_at = datetime.now() + timedelta(seconds=3500)
+            if self.token_cache:
+                self.token_cache.store(self.hostname, self.email, self.token, self.token_expires_at)
+
+        except httpx.HTTPStatusError as e:
+            raise AuthenticationError(f"Authentication failed: {e.response.text}") from e
+        except ValueError as e:
+            raise AuthenticationError(f"Authentication failed: invalid JSON in response: {e}") from e
+        except httpx.HTTPError as e:
+            raise APIConnectionError(f"Authentication failed: {e}") from e
@@ -0,0 +1,73 @@
+# auth.py
+import os
+import json
+import threading
+import tempfile
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class TokenCache:
+    """
+    Файловый кэш токенов, общий для короткоживущих процессов (cron, CLI).
+    Токены хранятся по ключу hostname + email, файл доступен только владельцу
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(hostname: str, email: str) -> str:
+        return f"{hostname}|{email}"
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: dict):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.alfacrm-token-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.chmod(tmp_path, 0o600)
+            # Замена атомарна: параллельный процесс не прочитает наполовину записанный файл
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, hostname: str, email: str) -> Optional[Tuple[str, datetime]]:
+        """Неистекший токен из кэша или None"""
+        entry = self._read().get(self._key(hostname, email))
+        if not entry:
+            return None
+        try:
+            expires_at = datetime.fromisoformat(entry['expires_at'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not entry.get('token') or datetime.now() >= expires_at:
+            return None
+        return entry['token'], expires_at
+
+    def store(self, hostname: str, email: str, token: str, expires_at: datetime):
+        """Сохранение токена"""
+        with self._lock:
+            data = self._read()
+            data[self._key(hostname, email)] = {'token': token, 'expires_at': expires_at.isoformat()}
+            self._write(data)
+
+    def invalidate(self, hostname: str, email: str, token: str = None):
+        """Удаление токена (только если он совпадает с переданным)"""
+        with self._lock:
+            data = self._read()
+            entry = data.get(self._key(hostname, email))
+            if entry and (token is None or entry.get('token') == token):
+                del data[self._key(hostname, email)]
+                self._write(data)
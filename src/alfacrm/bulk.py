@@ -0,0 +1,99 @@
+# bulk.py
+import threading
+from typing import Any, Dict, Optional, Type
+from pydantic import ValidationError
+from .exceptions import APIClientError
+from .models import ALFABaseModel
+from .records import CompactRecord, LazyRecord, field_adapter
+
+
+def created_id(response: Any) -> Optional[int]:
+    """id созданной записи из ответа create (поле model.id или id)"""
+    if not isinstance(response, dict):
+        return None
+    model = response.get('model')
+    if isinstance(model, dict) and 'id' in model:
+        return model['id']
+    return response.get('id')
+
+
+class BulkResult:
+    """Результат для одной записи пакетной операции: ответ API или ошибка"""
+    __slots__ = ('index', 'response', 'error')
+
+    def __init__(self, index: int, response: Dict = None, error: APIClientError = None):
+        self.index = index
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def id(self) -> Optional[int]:
+        return created_id(self.response)
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f"BulkResult(index={self.index}, error={self.error!r})"
+        return f"BulkResult(index={self.index}, id={self.id!r})"
+
+
+class UpdateStats:
+    """Потокобезопасные счетчики update_diff: отправленные и пропущенные обновления"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.skipped = 0
+        self.fields_sent = 0
+
+    def record_sent(self, fields: int):
+        with self._lock:
+            self.sent += 1
+            self.fields_sent += fields
+
+    def record_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self) -> Dict:
+        """Копия текущих значений счетчиков"""
+        with self._lock:
+            return {'sent': self.sent, 'skipped': self.skipped, 'fields_sent': self.fields_sent}
+
+
+def record_dict(record: Any) -> Dict:
+    """Словарь из записи любого формата records (dict, модель, LazyRecord, CompactRecord)"""
+    if isinstance(record, dict):
+        return record
+    if isinstance(record, LazyRecord):
+        return record.raw
+    if isinstance(record, CompactRecord):
+        return record.to_dict()
+    return record.model_dump(mode='json')
+
+
+def diff_fields(model: Optional[Type[ALFABaseModel]], desired: Dict, current: Any) -> Dict:
+    """
+    Поля desired (уже проверенные моделью), значения которых отличаются от current.
+    Значения current приводятся типом поля модели, чтобы '2024-01-05' и date(2024, 1, 5) совпадали
+    """
+    current = record_dict(current)
+    changed = {}
+    for name, value in desired.items():
+        spec = field_adapter(model, name) if model else None
+        key = spec[0] if spec else name
+        if key not in current and name not in current:
+            changed[name] = value
+            continue
+        existing = current[key] if key in current else current[name]
+        if spec is not None and existing is not None:
+            try:
+                existing = spec[1].dump_python(spec[1].validate_python(existing), mode='json')
+            except ValidationError:
+                pass
+        if existing != value:
+            changed[name] = value
+    return changed
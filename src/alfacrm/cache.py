@@ -0,0 +1,95 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from .codec import default_codec
+
+
+class ResponseCache:
+    """
+    Кэш ответов index по ключу (хост, филиал, сущность, параметры фильтра) с вытеснением LRU,
+    TTL и ограничением общего размера. Ответы хранятся сериализованными: размер учитывается точно,
+    а изменение полученного словаря не портит кэш. Запись через клиент сбрасывает запросы сущности
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, max_bytes: Optional[int] = 16 * 1024 * 1024, codec=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.codec = codec or default_codec()
+        self._entries: 'OrderedDict[Hashable, Tuple[bytes, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Счетчики сбросов по (хост, филиал, сущность): ответ, запрошенный до сброса
+        # своей области, не сохраняется, записи в другие области на него не влияют
+        self._generations: Dict[Tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Ответ из кэша или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self.codec.loads(entry[0])
+
+    def generation(self, key: Hashable) -> int:
+        """Счетчик сбросов области ключа; запоминается перед запросом и передается в put"""
+        with self._lock:
+            return self._generations.setdefault(key[:3], 0)
+
+    def put(self, key: Hashable, response: Any, generation: int = None):
+        """Сохранение ответа; generation - значение self.generation(key) перед запросом"""
+        data = self.codec.dumps(response)
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key[:3], 0):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, time.monotonic())
+            self.size += len(data)
+            while self._entries and (
+                    len(self._entries) > self.maxsize or
+                    (self.max_bytes is not None and self.size > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        data, _ = self._entries.pop(key)
+        self.size -= len(data)
+
+    @staticmethod
+    def _matches(key: tuple, entity_name: Optional[str], branch_id: Optional[int], hostname: Optional[str]) -> bool:
+        return (
+            (hostname is None or key[0] == hostname) and
+            (branch_id is None or key[1] in (branch_id, None)) and
+            (entity_name is None or key[2] == entity_name)
+        )
+
+    def invalidate(self, entity_name: str = None, branch_id: int = None, hostname: str = None):
+        """Сброс всего кэша или запросов сущности (в филиале, на хосте)"""
+        with self._lock:
+            for scope in self._generations:
+                if self._matches(scope, entity_name, branch_id, hostname):
+                    self._generations[scope] += 1
+            for key in list(self._entries):
+                if self._matches(key, entity_name, branch_id, hostname):
+                    self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и текущий размер кэша"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self.size}
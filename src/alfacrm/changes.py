@@ -0,0 +1,176 @@
+# changes.py
+import re
+import threading
+from datetime import date, datetime
+from time import sleep
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from pydantic import BaseModel, Field
+
+# Коды событий в логе ALFA CRM
+LOG_EVENTS = {1: 'create', 2: 'update', 3: 'delete'}
+
+
+class ChangeEvent(BaseModel):
+    """Изменение сущности, разобранное из записи лога"""
+    id: int = Field(..., description="ID записи лога")
+    entity: str = Field(..., description="Имя сущности в API (customer, study-status...)")
+    entity_id: Optional[int] = None
+    action: str = Field(..., description="create, update или delete")
+    event: Optional[int] = Field(None, description="Исходный код события")
+    user_id: Optional[int] = None
+    branch_id: Optional[int] = None
+    event_date: Optional[date] = Field(None, description="Дата события")
+    old: Dict[str, Any] = Field(default_factory=dict, description="Значения полей до изменения")
+    new: Dict[str, Any] = Field(default_factory=dict, description="Значения полей после изменения")
+
+    @property
+    def changed_fields(self) -> List[str]:
+        """Поля, значения которых отличаются"""
+        return [key for key in {**self.old, **self.new} if self.old.get(key) != self.new.get(key)]
+
+
+def _entity_key(name: str) -> str:
+    """Имя сущности без регистра и разделителей: StudyStatus, study_status и study-status совпадают"""
+    return re.sub(r'[-_\s]', '', name or '').lower()
+
+
+def decode_fields(value: Any) -> Dict[str, Any]:
+    """
+    Значения полей из fields_old / fields_new: словарь, список словарей
+    или список пар вида {'name'|'field': ..., 'value': ...}
+    """
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return dict(value)
+
+    fields = {}
+    for part in value:
+        if not isinstance(part, dict):
+            continue
+        name = part.get('name', part.get('field'))
+        if name is not None and 'value' in part and len(part) <= 3:
+            fields[name] = part['value']
+        else:
+            fields.update(part)
+    return fields
+
+
+class ChangeFeed:
+    """
+    Лента изменений по логу филиала. Лог запрашивается с даты последнего события
+    (фильтр работает с точностью до дня), уже полученные записи отсекаются по id.
+    Подписчики вызываются для каждого события по порядку id:
+    feed.attach_caches() сбрасывает кэши клиента, feed.attach_replica(replica) обновляет локальную копию
+    """
+
+    def __init__(
+            self,
+            client,
+            branch_id: int = None,
+            entities: Iterable[str] = None,
+            since: date = None,
+            last_id: int = 0,
+            interval: float = 30.0
+    ):
+        self.client = client
+        self.branch_id = branch_id
+        self.interval = interval
+        self.since = since or date.today()
+        self.last_id = last_id
+        self._subscribers: List[Callable[[ChangeEvent], Any]] = []
+        self._lock = threading.Lock()
+
+        self._entity_names = {
+            _entity_key(handler.entity_name): handler.entity_name
+            for handler in vars(client).values() if isinstance(handler, client.Entity)
+        }
+        self.entities = {_entity_key(name) for name in entities} if entities else None
+
+    @property
+    def cursor(self) -> Dict[str, Any]:
+        """Позиция ленты для сохранения между запусками: ChangeFeed(client, **feed.cursor)"""
+        return {'since': self.since, 'last_id': self.last_id}
+
+    def subscribe(self, callback: Callable[[ChangeEvent], Any]) -> Callable[[ChangeEvent], Any]:
+        self._subscribers.append(callback)
+        return callback
+
+    def _decode(self, item: Dict) -> Optional[ChangeEvent]:
+        key = _entity_key(item.get('entity'))
+        if self.entities is not None and key not in self.entities:
+            return None
+        try:
+            event_date = datetime.strptime(item.get('date_time', '')[:10], '%d.%m.%Y').date()
+        except ValueError:
+            event_date = None
+        return ChangeEvent(
+            id=item['id'],
+            entity=self._entity_names.get(key, item.get('entity') or ''),
+            entity_id=item.get('entity_id'),
+            action=LOG_EVENTS.get(item.get('event'), 'update'),
+            event=item.get('event'),
+            user_id=item.get('user_id'),
+            branch_id=self.branch_id or self.client.log._current_branch(),
+            event_date=event_date,
+            old=decode_fields(item.get('fields_old')),
+            new=decode_fields(item.get('fields_new'))
+        )
+
+    def poll(self) -> List[ChangeEvent]:
+        """Новые события с прошлого опроса"""
+        with self._lock:
+            log = self.client.log.for_branch(self.branch_id) if self.branch_id else self.client.log
+            params = {'date_from': self.since.strftime('%d.%m.%Y')}
+            if self.entities is not None and len(self.entities) == 1:
+                params['entity'] = next(iter(self._entity_names.get(key, key) for key in self.entities))
+
+            items = sorted(
+                (item for item in log.iter_items(**params) if item.get('id', 0) > self.last_id),
+                key=lambda item: item['id']
+            )
+            events = []
+            for item in items:
+                self.last_id = item['id']
+                event = self._decode(item)
+                if event is None:
+                    continue
+                if event.event_date and event.event_date > self.since:
+                    self.since = event.event_date
+                events.append(event)
+
+        for event in events:
+            for callback in self._subscribers:
+                callback(event)
+        return events
+
+    def stream(self, stop: threading.Event = None) -> Iterator[ChangeEvent]:
+        """Бесконечный опрос лога с интервалом interval; stop.set() завершает поток событий"""
+        while stop is None or not stop.is_set():
+            yield from self.poll()
+            if stop is not None:
+                stop.wait(self.interval)
+            else:
+                sleep(self.interval)
+
+    def attach_caches(self):
+        """Сброс кэшей клиента (справочники, ответы index) по событиям ленты"""
+        def invalidate(event: ChangeEvent):
+            if self.client.reference is not None:
+                self.client.reference.invalidate_entity(event.entity, event.branch_id)
+            if self.client.response_cache is not None:
+                self.client.response_cache.invalidate(event.entity, event.branch_id, self.client.hostname)
+        return self.subscribe(invalidate)
+
+    def attach_replica(self, replica):
+        """Применение событий к SQLiteReplica: удаление строк и наложение новых значений полей"""
+        entity_names = {getattr(self.client, entity).entity_name for entity in replica.entities}
+
+        def apply(event: ChangeEvent):
+            if event.entity_id is None or event.entity not in entity_names:
+                return
+            if event.action == 'delete':
+                replica.delete(event.entity, event.branch_id, [event.entity_id])
+            elif event.new:
+                replica.patch(event.entity, event.branch_id, event.entity_id, event.new)
+        return self.subscribe(apply)
@@ -1,24 +1,170 @@
 # client.py
+import copy
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 import requests
-from typing import Type, Dict, Optional, Any
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from time import perf_counter, sleep
+from typing import Type, Dict, Optional, Any, Callable, Iterable, Iterator, List, Tuple, Union
 from pydantic import ValidationError
+from urllib3.exceptions import MaxRetryError, NewConnectionError
 from datetime import datetime, timedelta
 from .exceptions import *
 from .models import *
+from .session import create_session, IdleConnectionReaper
+from .ratelimit import RateLimiter, parse_retry_after
+from .retry import RetryPolicy, RetryStats
+from .auth import TokenCache
+from .codec import default_codec
+from .refcache import ReferenceCache
+from .cache import ResponseCache
+from .bulk import BulkResult, UpdateStats, diff_fields, record_dict
+from .coalesce import WriteBuffer
+from .hooks import RequestEvent, RequestHooks
+from .records import RECORD_FORMATS, LazyRecord, RecordTable, validate_items
+from .columns import ColumnBuilder, require_numpy, require_arrow
+
+
+def _not_sent(error: requests.RequestException) -> bool:
+    """
+    Соединение не установлено, запрос точно не дошел до сервера (как httpx.ConnectError / ConnectTimeout).
+    Разрыв уже установленного соединения requests тоже сообщает как ConnectionError, но без NewConnectionError
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return (
+        isinstance(error, requests.ConnectionError) and
+        isinstance(reason, MaxRetryError) and
+        isinstance(reason.reason, NewConnectionError)
+    )
 
 
 class ALFACRM:
     """Основной клиент для работы с API ALFA CRM"""
 
-    def __init__(self, hostname: str, email: str, api_key: str):
+    def __init__(
+            self,
+            hostname: str,
+            email: str,
+            api_key: str,
+            session: Optional[requests.Session] = None,
+            pool_connections: int = 10,
+            pool_maxsize: int = 10,
+            pool_block: bool = False,
+            keepalive_expiry: Optional[float] = None,
+            max_workers: int = 4,
+            rate_limiter: Optional[RateLimiter] = None,
+            rate_limit: Optional[float] = None,
+            max_rate_limit_retries: int = 5,
+            rate_limit_backoff: float = 1.0,
+            retry_policy: Optional[RetryPolicy] = None,
+            timeout: Optional[float] = 60.0,
+            token_cache: Union[TokenCache, str, None] = None,
+            token_refresh_margin: float = 300.0,
+            codec: Optional[Any] = None,
+            reference_ttl: float = 300.0,
+            response_cache: Optional[ResponseCache] = None,
+            coalesce_window: Optional[float] = None
+    ):
+        self._init_common(
+            hostname, email, api_key,
+            max_workers=max_workers,
+            rate_limiter=rate_limiter,
+            rate_limit=rate_limit,
+            max_rate_limit_retries=max_rate_limit_retries,
+            rate_limit_backoff=rate_limit_backoff,
+            retry_policy=retry_policy,
+            timeout=timeout,
+            token_cache=token_cache,
+            token_refresh_margin=token_refresh_margin,
+            codec=codec,
+            response_cache=response_cache
+        )
+
+        # Сессия с пулом соединений общая для всех сущностей и переживает обновление токена.
+        # Переданную снаружи сессию клиент не закрывает
+        self._owns_session = session is None
+        self.session = session or create_session(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        self._reaper = IdleConnectionReaper(self.session, keepalive_expiry)
+        self._auth_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+        self._init_entities()
+
+        # Справочники (статусы, предметы, комнаты...) по филиалам: client.reference.name('study_status', 1)
+        self.reference = ReferenceCache(self, ttl=reference_ttl)
+        # Отложенные update: изменения одной записи за coalesce_window секунд уходят одним запросом
+        self.write_buffer = WriteBuffer(self, coalesce_window) if coalesce_window else None
+
+    def _init_common(
+            self,
+            hostname: str,
+            email: str,
+            api_key: str,
+            max_workers: int,
+            rate_limiter: Optional[RateLimiter],
+            rate_limit: Optional[float],
+            max_rate_limit_retries: int,
+            rate_limit_backoff: float,
+            retry_policy: Optional[RetryPolicy],
+            timeout: Optional[float],
+            token_cache: Union[TokenCache, str, None],
+            token_refresh_margin: float,
+            codec: Optional[Any],
+            response_cache: Optional[ResponseCache]
+    ):
+        """Настройки, общие для синхронного и асинхронного клиентов (без транспорта и блокировок)"""
         self.hostname = hostname
         self.email = email
         self.api_key = api_key
         self.token: Optional[str] = None
         self.token_expires_at: Optional[datetime] = None
         self.branch_id: Optional[int] = None
-
-        self._init_entities()
+        # Филиал текущего потока/задачи (branch_scope); у каждого клиента своя переменная
+        self._branch_scope: ContextVar = ContextVar(f'alfacrm_branch_{id(self)}', default=None)
+        self.max_workers = max_workers
+
+        # Ограничитель можно передать общий для нескольких клиентов или задать частотой rate_limit (запросов/сек)
+        self.rate_limiter = rate_limiter or (RateLimiter(rate_limit) if rate_limit else None)
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limit_backoff = rate_limit_backoff
+
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_stats = RetryStats()
+        self.update_stats = UpdateStats()
+        # Обработчики событий запросов: client.hooks.add('after_response', callback)
+        self.hooks = RequestHooks()
+        self.timeout = timeout
+
+        # Кэш токена можно передать путем к файлу
+        self.token_cache = TokenCache(token_cache) if isinstance(token_cache, str) else token_cache
+        self.token_refresh_margin = token_refresh_margin
+
+        # Кодек JSON: объекты с методами dumps(obj) -> bytes и loads(bytes)
+        self.codec = codec or default_codec()
+        # Кэш ответов index (по умолчанию выключен); можно передать общий для нескольких клиентов
+        self.response_cache = response_cache
+
+    def __enter__(self) -> 'ALFACRM':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Отправка отложенных update и закрытие пула соединений"""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+        if self._owns_session:
+            self.session.close()
 
     class Entity:
         """Универсальный обработчик для сущностей API"""
@@ -30,7 +176,8 @@ class ALFACRM:
                 filter_model: Type[ALFABaseModel] = None,
                 create_model: Type[ALFABaseModel] = None,
                 update_model: Type[ALFABaseModel] = None,
-                branch_required: bool = False
+                branch_required: bool = False,
+                response_model: Type[ALFABaseModel] = None
         ):
             self.parent = parent
             self.entity_name = entity_name
@@ -38,15 +185,34 @@ class ALFACRM:
             self.create_model = create_model
             self.update_model = update_model
             self.branch_required = branch_required
+            self.response_model = response_model
+            self._branch_id: Optional[int] = None
+
+        def _current_branch(self) -> Optional[int]:
+            """Филиал запроса: привязанный к обработчику (for_branch), из branch_scope или client.branch_id"""
+            if self._branch_id is not None:
+                return self._branch_id
+            scoped = self.parent._branch_scope.get()
+            return scoped if scoped is not None else self.parent.branch_id
+
+        def for_branch(self, branch_id: int) -> 'ALFACRM.Entity':
+            """
+            Копия обработчика, привязанная к филиалу. Не меняет client.branch_id,
+            поэтому копии для разных филиалов можно использовать параллельно
+            """
+            scoped = copy.copy(self)
+            scoped._branch_id = branch_id
+            return scoped
 
         def _build_url(self, action: str, **params) -> str:
             """Формирование URL с учетом особенностей API ALFA CRM"""
             parts = []
 
             if self.branch_required:
-                if not self.parent.branch_id:
+                branch_id = self._current_branch()
+                if not branch_id:
                     raise MissingBranchError("Branch ID is required for this entity")
-                parts.append(str(self.parent.branch_id))
+                parts.append(str(branch_id))
 
             parts.append(self.entity_name)
 
@@ -61,62 +227,341 @@ class ALFACRM:
 
             return url
 
-        def index(self, **params) -> Dict:
-            """Получение списка сущностей с фильтрацией"""
+        @staticmethod
+        def _validate(model: Type[ALFABaseModel], data: Dict) -> Dict:
+            """Валидация данных запроса pydantic-моделью; даты сразу приводятся к JSON-виду"""
             try:
-                validated_params = self.filter_model(**params).model_dump(
-                    exclude_none=True) if self.filter_model else {}
+                return model(**data).model_dump(mode='json', exclude_none=True)
             except ValidationError as e:
                 raise RequestValidationError(e.errors()) from e
 
-            if 'page' not in validated_params:
-                return self._paginated_request(validated_params)
-            return self.parent._request('POST', self._build_url('index'), data=validated_params)
+        def _validate_filter(self, params: Dict) -> Dict:
+            """Валидация параметров фильтрации"""
+            return self._validate(self.filter_model, params) if self.filter_model else {}
+
+        def _convert_items(self, items: List[Dict], records: str) -> List:
+            """Приведение записей страницы к формату records (см. RECORD_FORMATS)"""
+            if records == 'dict':
+                return items
+            if records not in RECORD_FORMATS:
+                raise ValueError(f"Неизвестный формат записей: {records}")
+            if records == 'compact':
+                return RecordTable(items)
+            if not self.response_model:
+                raise ValueError(f"Для сущности {self.entity_name} не задана модель ответа")
+            if records == 'lazy':
+                return [LazyRecord(self.response_model, item) for item in items]
+            return validate_items(self.response_model, items)
+
+        def _convert_page(self, response: Dict, records: str) -> Dict:
+            if records == 'dict':
+                return response
+            return {**response, 'items': self._convert_items(response.get('items', []), records)}
+
+        def index(self, *, records: str = 'dict', **params) -> Dict:
+            """
+            Получение списка сущностей с фильтрацией.
+            records='model' возвращает записи как экземпляры response_model,
+            records='lazy' - как LazyRecord с проверкой полей при обращении,
+            records='compact' - одной RecordTable с общей схемой ключей
+            """
+            validated_params = self._validate_filter(params)
+
+            cache = self.parent.response_cache
+            if cache is None:
+                return self._fetch_index(validated_params, records)
+
+            key = self._cache_key(validated_params)
+            response = cache.get(key)
+            if response is None:
+                generation = cache.generation(key)
+                response = self._fetch_index(validated_params)
+                cache.put(key, response, generation)
+            return self._convert_page(response, records)
+
+        def _fetch_index(self, params: Dict, records: str = 'dict') -> Dict:
+            if 'page' not in params:
+                return self._paginated_request(params, records)
+            response = self.parent._request('POST', self._build_url('index'), data=params, action='index', entity=self)
+            return self._convert_page(response, records)
+
+        def _cache_branch(self) -> Optional[int]:
+            """Филиал для ключа кэша; у сущностей вне филиалов - None"""
+            return self._current_branch() if self.branch_required else None
+
+        def _cache_key(self, params: Dict) -> tuple:
+            return self.parent.hostname, self._cache_branch(), self.entity_name, self.parent.codec.dumps(params)
 
         def create(self, **data) -> Dict:
             """Создание новой сущности"""
-            try:
-                validated = self.create_model(**data).model_dump(exclude_none=True) if self.create_model else data
-            except ValidationError as e:
-                raise RequestValidationError(e.errors()) from e
-
-            return self.parent._request('POST', self._build_url('create'), data=validated)
-
-        def update(self, entity_id: int, **data) -> Dict:
-            """Обновление существующей сущности"""
-            try:
-                validated = self.update_model(**data).model_dump(exclude_none=True) if self.update_model else data
-            except ValidationError as e:
-                raise RequestValidationError(e.errors()) from e
-
-            return self.parent._request('POST', self._build_url('update', id=entity_id), data=validated)
+            validated = self._validate(self.create_model, data) if self.create_model else data
+
+            result = self.parent._request('POST', self._build_url('create'), data=validated, action='create', entity=self)
+            self.parent._after_write(self)
+            return result
+
+        def create_many(self, records: Iterable[Dict], max_workers: int = None) -> List[BulkResult]:
+            """
+            Пакетное создание: сначала проверяются все записи, затем корректные отправляются
+            параллельно (не больше max_workers запросов, с учетом ограничителя частоты).
+            Результаты - BulkResult в порядке records: ответ API с id или ошибка проверки/запроса
+            """
+            results, jobs = self._validate_many(records)
+
+            def send(job):
+                index, validated = job
+                try:
+                    response = self.parent._request('POST', self._build_url('create'), data=validated, action='create', entity=self)
+                except APIClientError as e:
+                    return BulkResult(index, error=e)
+                return BulkResult(index, response=response)
+
+            for result in self.parent._imap_concurrent(send, jobs, max_workers):
+                results[result.index] = result
+            if any(result.ok for result in results):
+                self.parent._after_write(self)
+            return results
+
+        def _validate_many(self, records: Iterable[Dict]) -> tuple:
+            """Проверка записей create_many: результаты с ошибками и список (индекс, данные) для отправки"""
+            results, jobs = [], []
+            for index, data in enumerate(records):
+                try:
+                    jobs.append((index, self._validate(self.create_model, data) if self.create_model else data))
+                    results.append(None)
+                except RequestValidationError as e:
+                    results.append(BulkResult(index, error=e))
+            return results, jobs
+
+        def update(self, entity_id: int, **data) -> Union[Dict, Future]:
+            """
+            Обновление существующей сущности.
+            С coalesce_window у клиента запрос откладывается и объединяется с другими update той же
+            записи; возвращается Future с ответом API (client.flush() отправляет накопленное сразу)
+            """
+            validated = self._validate(self.update_model, data) if self.update_model else data
+            if self.parent.write_buffer is not None:
+                return self.parent.write_buffer.submit(self, entity_id, validated)
+            return self._send_update(entity_id, validated)
+
+        def _send_update(self, entity_id: int, validated: Dict) -> Dict:
+            result = self.parent._request(
+                'POST', self._build_url('update', id=entity_id), data=validated, action='update', entity=self
+            )
+            self.parent._after_write(self)
+            return result
+
+        def update_diff(self, entity_id: int, current: Any, **data) -> Union[Dict, Future, None]:
+            """
+            Обновление только измененных полей: data сравнивается с известным состоянием current
+            (запись из index, локальной копии и т.п.). Без изменений запрос не отправляется и
+            возвращается None; счетчики отправленных и пропущенных обновлений - client.update_stats.
+            С coalesce_window изменения идут через тот же буфер, что и update, а current дополняется
+            еще не отправленными изменениями записи
+            """
+            write_buffer = self.parent.write_buffer
+            if write_buffer is not None:
+                pending = write_buffer.pending(self, entity_id)
+                if pending:
+                    current = {**record_dict(current), **pending}
+            changed = self._diff(current, data)
+            if not changed:
+                self.parent.update_stats.record_skipped()
+                return None
+            self.parent.update_stats.record_sent(len(changed))
+            if write_buffer is not None:
+                return write_buffer.submit(self, entity_id, changed)
+            return self._send_update(entity_id, changed)
+
+        def _diff(self, current: Any, data: Dict) -> Dict:
+            validated = self._validate(self.update_model, data) if self.update_model else data
+            return diff_fields(self.update_model, validated, current)
 
         def delete(self, entity_id: int, **params) -> Dict:
             """Удаление сущности"""
-            return self.parent._request('POST', self._build_url('delete', **params, id=entity_id))
-
-        def _paginated_request(self, params: Dict) -> Dict:
-            """Автоматическая обработка пагинации"""
-            all_items = []
-            page = 0
-            total = 0
-
-            while True:
-                params['page'] = page
-                response = self.parent._request('POST', self._build_url('index'), data=params)
-                items = response.get('items', [])
-                all_items.extend(items)
+            result = self.parent._request(
+                'POST', self._build_url('delete', **params, id=entity_id), action='delete', entity=self
+            )
+            self.parent._after_write(self)
+            return result
 
-                if total == 0:
-                    total = response.get('total', 0)
+        def _request_page(self, params: Dict, page: int) -> Dict:
+            """Запрос одной страницы списка"""
+            return self.parent._request(
+                'POST', self._build_url('index'), data={**params, 'page': page}, action='index', entity=self
+            )
 
-                if not items or len(all_items) >= total:
+        def iter_pages(self, *, records: str = 'dict', **params) -> Iterator[Dict]:
+            """
+            Постраничный обход результатов: страницы отдаются по мере получения,
+            впереди запрашивается не больше max_workers страниц
+            """
+            validated_params = self._validate_filter(params)
+            return (self._convert_page(response, records) for response in self._iter_pages(validated_params))
+
+        def iter_items(self, *, records: str = 'dict', **params) -> Iterator:
+            """Обход всех записей без накопления списка в памяти"""
+            for response in self.iter_pages(records=records, **params):
+                yield from response.get('items', [])
+
+        def first(self, *, records: str = 'dict', **params) -> Optional[Any]:
+            """Первая запись, удовлетворяющая фильтру (один запрос)"""
+            items = self.take(1, records=records, **params)
+            return items[0] if items else None
+
+        def exists(self, **params) -> bool:
+            """Есть ли хотя бы одна запись, удовлетворяющая фильтру"""
+            return self.first(**params) is not None
+
+        def take(self, n: int, *, records: str = 'dict', **params) -> List:
+            """Не больше n записей: запрашиваются только нужные страницы"""
+            items = []
+            if n <= 0:
+                return items
+
+            for response in self._iter_pages(self._validate_filter(params), limit=n):
+                items.extend(response.get('items', [])[:n - len(items)])
+                if len(items) >= n:
                     break
-
-                page += 1
+            return self._convert_items(items, records)
+
+        def count(self, **params) -> int:
+            """Количество записей по фильтру: читается только total первой страницы"""
+            validated_params = self._validate_filter(params)
+            return self._request_page(validated_params, validated_params.get('page', 0)).get('total', 0)
+
+        def counts(self, queries: Dict[Any, Dict], max_workers: int = None) -> Dict[Any, int]:
+            """
+            Параллельный подсчет для набора фильтров:
+            {'active': {'is_study': 1}, 'leads': {'is_study': 0}} -> {'active': 120, 'leads': 45}
+            """
+            keys = list(queries)
+            totals = self.parent._map_concurrent(lambda key: self.count(**queries[key]), keys, max_workers)
+            return dict(zip(keys, totals))
+
+        def index_all_branches(
+                self,
+                branch_ids: Iterable[int] = None,
+                *,
+                records: str = 'dict',
+                max_workers: int = None,
+                **params
+        ) -> Dict:
+            """
+            Один и тот же запрос по нескольким филиалам параллельно (по умолчанию - по всем), со всеми страницами.
+            items - пары (branch_id, запись) в порядке branch_ids, totals - число записей по каждому филиалу,
+            total - их сумма
+            """
+            items, totals = [], {}
+            for branch_id, pages in self._branch_pages(branch_ids, max_workers, params):
+                totals[branch_id] = 0
+                for response in pages:
+                    page_items = response.get('items', [])
+                    totals[branch_id] += len(page_items)
+                    items.extend((branch_id, item) for item in self._convert_items(page_items, records))
+            return {'items': items, 'total': sum(totals.values()), 'totals': totals}
+
+        def iter_all_branches(
+                self,
+                branch_ids: Iterable[int] = None,
+                *,
+                records: str = 'dict',
+                max_workers: int = None,
+                **params
+        ) -> Iterator[Tuple[int, Any]]:
+            """
+            Пары (branch_id, запись) по всем филиалам без накопления в памяти: первые страницы филиалов
+            запрашиваются параллельно, остальные страницы филиала - по мере обхода
+            """
+            for branch_id, pages in self._branch_pages(branch_ids, max_workers, params):
+                for response in pages:
+                    for item in self._convert_items(response.get('items', []), records):
+                        yield branch_id, item
+
+        def _branch_pages(
+                self,
+                branch_ids: Optional[Iterable[int]],
+                max_workers: int,
+                params: Dict
+        ) -> Iterator[Tuple[int, Iterator[Dict]]]:
+            """Страницы каждого филиала по порядку; страницы филиала нужно прочитать до перехода к следующему"""
+            if not self.branch_required:
+                raise ValueError(f"Сущность {self.entity_name} не привязана к филиалу")
+            branch_ids = list(branch_ids) if branch_ids is not None else self.parent._branch_ids()
+            validated_params = self._validate_filter(params)
+            first_page = validated_params.get('page', 0)
+            responses = self.parent._imap_concurrent(
+                lambda branch_id: self.for_branch(branch_id)._request_page(validated_params, first_page),
+                branch_ids,
+                max_workers
+            )
+            for branch_id, response in zip(branch_ids, responses):
+                yield branch_id, self.for_branch(branch_id)._iter_pages(validated_params, first=response)
+
+        def to_columns(self, fields: List[str] = None, date_fields: List[str] = None, **params) -> Dict[str, Any]:
+            """
+            Выгрузка в колонки numpy: страницы раскладываются по типизированным буферам по мере получения.
+            Типы берутся из response_model, поля *_date и dob становятся datetime64[D].
+            fields ограничивает набор колонок, date_fields переопределяет поля-даты
+            """
+            require_numpy()
+            return self._build_columns(fields, date_fields, params).to_numpy()
+
+        def to_arrow(self, fields: List[str] = None, date_fields: List[str] = None, **params):
+            """Выгрузка в pyarrow.Table (см. to_columns)"""
+            require_arrow()
+            return self._build_columns(fields, date_fields, params).to_arrow()
+
+        def to_parquet(self, path: str, fields: List[str] = None, date_fields: List[str] = None, **params):
+            """Выгрузка в файл Parquet (см. to_columns)"""
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(self.to_arrow(fields, date_fields, **params), path)
+
+        def _build_columns(self, fields: Optional[List[str]], date_fields: Optional[List[str]], params: Dict):
+            builder = ColumnBuilder(self.response_model, fields, date_fields)
+            for response in self.iter_pages(**params):
+                builder.add_items(response.get('items', []))
+            return builder
+
+        def _iter_pages(self, params: Dict, limit: int = None, first: Dict = None) -> Iterator[Dict]:
+            """
+            Первая страница дает total, остальные запрашиваются параллельно и отдаются по порядку.
+            limit ограничивает число запрашиваемых страниц нужным количеством записей,
+            first - уже полученная первая страница
+            """
+            first_page = params.get('page', 0)
+            response = first if first is not None else self._request_page(params, first_page)
+            page_size = len(response.get('items', []))
+            if not page_size:
+                return
+
+            pages = self._remaining_pages(first_page, page_size, response.get('total', 0), limit)
+            yield response
+
+            for response in self.parent._imap_concurrent(lambda page: self._request_page(params, page), pages):
+                if response.get('items'):
+                    yield response
+
+        def _paginated_request(self, params: Dict, records: str = 'dict') -> Dict:
+            """Автоматическая обработка пагинации"""
+            # Компактная таблица заполняется напрямую, без промежуточных таблиц на каждую страницу
+            all_items = RecordTable() if records == 'compact' else []
+            for response in self._iter_pages(params):
+                items = response.get('items', [])
+                all_items.extend(items if records == 'compact' else self._convert_items(items, records))
 
             return {'items': all_items, 'total': len(all_items)}
 
+        @staticmethod
+        def _remaining_pages(first_page: int, page_size: int, total: int, limit: int = None) -> range:
+            """Номера страниц, оставшихся после первой (с учетом лимита записей)"""
+            if not page_size:
+                return range(0)
+            last_page = -(-total // page_size)
+            if limit is not None:
+                last_page = min(last_page, first_page + -(-limit // page_size))
+            return range(first_page + 1, last_page)
+
     def _init_entities(self):
         """Инициализация всех поддерживаемых сущностей"""
         self.customer = self.Entity(
@@ -125,6 +570,7 @@ class ALFACRM:
             filter_model=CustomerFilter,
             create_model=CustomerCreate,
             update_model=CustomerUpdate,
+            response_model=CustomerResponse,
             branch_required=True
         )
 
@@ -143,6 +589,7 @@ class ALFACRM:
             filter_model=CGICustomerFilter,
             create_model=CGICreate,
             update_model=CGIUpdate,
+            response_model=CGIResponse,
             branch_required=True
         )
 
@@ -152,6 +599,7 @@ class ALFACRM:
             filter_model=CGIGroupFilter,
             create_model=CGICreate,
             update_model=CGIUpdate,
+            response_model=CGIResponse,
             branch_required=True
         )
 
@@ -161,6 +609,7 @@ class ALFACRM:
             filter_model=CommunicationFilter,
             create_model=CommunicationCreate,
             update_model=CustomerUpdate,
+            response_model=CommunicationResponse,
             branch_required=True
         )
 
@@ -170,6 +619,7 @@ class ALFACRM:
             filter_model=CustomerTariffFilter,
             update_model=CustomerTariffUpdate,
             create_model=CustomerTariffCreate,
+            response_model=CustomerTariffResponse,
             branch_required=True
         )
 
@@ -179,6 +629,7 @@ class ALFACRM:
             filter_model=GroupFilter,
             update_model=GroupBase,
             create_model=GroupCreate,
+            response_model=GroupResponse,
             branch_required = True
         )
 
@@ -188,6 +639,7 @@ class ALFACRM:
             filter_model=LeadRejectFilter,
             update_model=LeadRejectUpdate,
             create_model=LeadRejectCreate,
+            response_model=LeadRejectResponse,
             branch_required = True
         )
 
@@ -198,6 +650,7 @@ class ALFACRM:
             filter_model=LocationFilter,
             create_model=LocationCreate,
             update_model=LocationUpdate,
+            response_model=LocationResponse,
             branch_required=True
         )
 
@@ -208,6 +661,7 @@ class ALFACRM:
             filter_model=RoomFilter,
             create_model=RoomCreate,
             update_model=RoomUpdate,
+            response_model=RoomResponse,
             branch_required=True
         )
 
@@ -218,6 +672,7 @@ class ALFACRM:
             filter_model=SubjectFilter,
             create_model=SubjectCreate,
             update_model=SubjectUpdate,
+            response_model=SubjectResponse,
             branch_required=True
         )
 
@@ -228,6 +683,7 @@ class ALFACRM:
             filter_model=StudyStatusFilter,
             create_model=StudyStatusCreate,
             update_model=StudyStatusUpdate,
+            response_model=StudyStatusResponse,
             branch_required=True
         )
 
@@ -238,6 +694,7 @@ class ALFACRM:
             filter_model=LeadStatusFilter,
             create_model=LeadStatusCreate,
             update_model=LeadStatusUpdate,
+            response_model=LeadStatusResponse,
             branch_required=True
         )
 
@@ -248,6 +705,7 @@ class ALFACRM:
             filter_model=LeadSourceFilter,
             create_model=LeadSourceCreate,
             update_model=LeadSourceUpdate,
+            response_model=LeadSourceResponse,
             branch_required=True
         )
 
@@ -258,6 +716,7 @@ class ALFACRM:
             filter_model=PayFilter,
             create_model=PayCreate,
             update_model=PayUpdate,
+            response_model=PayResponse,
             branch_required=True
         )
 
@@ -268,6 +727,7 @@ class ALFACRM:
             filter_model=LessonFilter,
             create_model=LessonCreate,
             update_model=LessonUpdate,
+            response_model=LessonResponse,
             branch_required=True
         )
 
@@ -286,6 +746,7 @@ class ALFACRM:
             self,
             'log',
             filter_model=LogFilter,
+            response_model=LogResponse,
             branch_required=True
         )
 
@@ -296,6 +757,7 @@ class ALFACRM:
             filter_model=RegularLessonFilter,
             create_model=RegularLessonCreate,
             update_model=RegularLessonUpdate,
+            response_model=RegularLessonResponse,
             branch_required=True
         )
 
@@ -306,6 +768,7 @@ class ALFACRM:
             filter_model=TariffFilter,
             create_model=TariffCreate,
             update_model=TariffUpdate,
+            response_model=TariffResponse,
             branch_required=True
         )
 
@@ -316,6 +779,7 @@ class ALFACRM:
             filter_model=TaskFilter,
             create_model=TaskCreate,
             update_model=TaskUpdate,
+            response_model=TaskResponse,
             branch_required=True
         )
 
@@ -326,6 +790,7 @@ class ALFACRM:
             filter_model=TeacherFilter,
             create_model=TeacherCreate,
             update_model=TeacherUpdate,
+            response_model=TeacherResponse,
             branch_required=True
         )
 
@@ -351,29 +816,183 @@ class ALFACRM:
 
         # Другие сущности инициализируются по аналогии
 
-    def _request(self, method: str, url: str, data: Dict = None) -> Dict:
-        """Базовый метод для выполнения запросов"""
-        if not self.token or datetime.now() >= self.token_expires_at:
-            self.authenticate()
-
-        headers = {
-            'X-ALFACRM-TOKEN': self.token,
-            'Content-Type': 'application/json'
-        }
-
+    def _imap_concurrent(self, fn: Callable[[Any], Any], items: Iterable, max_workers: int = None) -> Iterator:
+        """
+        Ленивое параллельное выполнение fn над items: в работе не больше max_workers задач,
+        результаты отдаются в исходном порядке. При досрочной остановке оставшиеся задачи отменяются
+        """
+        items = iter(items)
+        window = max_workers or self.max_workers
+        if window <= 1:
+            yield from map(fn, items)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=window)
+        pending = deque()
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                json=data,
-                headers=headers
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.HTTPError as e:
-            self._handle_http_error(e, response)
-        except requests.RequestException as e:
-            raise APIRequestError(f"Request failed: {str(e)}") from e
+            # Задачи выполняются в копии контекста вызывающего потока, чтобы действовал branch_scope
+            for item in islice(items, window):
+                pending.append(executor.submit(copy_context().run, fn, item))
+            while pending:
+                result = pending.popleft().result()
+                for item in islice(items, 1):
+                    pending.append(executor.submit(copy_context().run, fn, item))
+                yield result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _map_concurrent(self, fn: Callable[[Any], Any], items: Iterable, max_workers: int = None) -> List:
+        """Параллельное выполнение fn над items, порядок результатов сохраняется"""
+        return list(self._imap_concurrent(fn, items, max_workers))
+
+    def _request(
+            self,
+            method: str,
+            url: str,
+            data: Dict = None,
+            action: str = None,
+            entity: 'ALFACRM.Entity' = None
+    ) -> Dict:
+        """
+        Базовый метод для выполнения запросов.
+        Ответ 429 не прерывает работу: запрос повторяется после паузы из Retry-After.
+        Временные сбои повторяются по retry_policy с учетом идемпотентности action,
+        на 401 запрос повторяется один раз с новым токеном
+        """
+        token = self._ensure_token()
+        body = self.codec.dumps(data) if data is not None else None
+        attempt = 0
+        throttled = 0
+        replayed = False
+        tries = 0
+        while True:
+            headers = {
+                'X-ALFACRM-TOKEN': token,
+                'Content-Type': 'application/json'
+            }
+
+            self._throttle()
+            self._reaper.touch()
+            self.retry_stats.record_request()
+            event = self._request_event(method, url, data, body, action, entity, tries)
+            tries += 1
+            started = perf_counter()
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    data=body,
+                    headers=headers,
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                if self.retry_policy.should_retry(action, attempt, safe=_not_sent(e)):
+                    self._emit('on_retry', event, reason=type(e).__name__, error=e, elapsed=perf_counter() - started)
+                    self._retry_pause(type(e).__name__, attempt)
+                    attempt += 1
+                    continue
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason=type(e).__name__, error=e, elapsed=perf_counter() - started)
+                raise APIRequestError(f"Request failed: {str(e)}", status_code=None) from e
+
+            if event is not None:
+                # requests не сообщает время соединения: elapsed у ответа - до получения заголовков
+                elapsed = perf_counter() - started
+                wait = response.elapsed.total_seconds()
+                self._emit(
+                    'after_response', event, status_code=response.status_code, bytes_received=len(response.content),
+                    elapsed=elapsed, wait=wait, download=max(0.0, elapsed - wait)
+                )
+
+            # Токен мог быть отозван раньше срока: один раз получаем новый и повторяем запрос
+            if response.status_code == 401 and not replayed:
+                replayed = True
+                self._emit('on_retry', event, reason='HTTP 401')
+                token = self._refresh_token(token)
+                continue
+
+            if response.status_code == 429 and throttled < self.max_rate_limit_retries:
+                self.retry_stats.record_rate_limited()
+                self._emit('on_retry', event, reason='HTTP 429')
+                self._backoff_rate_limited(response, throttled)
+                throttled += 1
+                continue
+
+            if response.status_code in self.retry_policy.retry_statuses \
+                    and self.retry_policy.should_retry(action, attempt):
+                self._emit('on_retry', event, reason=f"HTTP {response.status_code}")
+                self._retry_pause(f"HTTP {response.status_code}", attempt)
+                attempt += 1
+                continue
+
+            try:
+                response.raise_for_status()
+                return self.codec.loads(response.content)
+            except requests.HTTPError as e:
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason=f"HTTP {response.status_code}", error=e)
+                self._handle_http_error(e, response)
+            except ValueError as e:
+                # Успешный статус, но тело ответа - не JSON (страница ошибки прокси и т.п.)
+                self.retry_stats.record_failure()
+                self._emit('on_error', event, reason='Invalid JSON', error=e)
+                raise APIRequestError(f"Invalid JSON in response: {e}", status_code=response.status_code) from e
+
+    def _request_event(
+            self,
+            method: str,
+            url: str,
+            data: Optional[Dict],
+            body: Optional[bytes],
+            action: Optional[str],
+            entity: Optional['ALFACRM.Entity'],
+            attempt: int
+    ) -> Optional[RequestEvent]:
+        """Событие before_request для очередной попытки; без обработчиков - None"""
+        if not self.hooks:
+            return None
+        event = RequestEvent(
+            method,
+            url,
+            entity=entity.entity_name if entity is not None else None,
+            action=action,
+            branch_id=entity._cache_branch() if entity is not None else None,
+            page=data.get('page') if isinstance(data, dict) else None,
+            attempt=attempt,
+            bytes_sent=len(body) if body else 0
+        )
+        self.hooks.emit('before_request', event)
+        return event
+
+    def _emit(self, name: str, event: Optional[RequestEvent], **fields):
+        if event is None:
+            return
+        for field, value in fields.items():
+            setattr(event, field, value)
+        self.hooks.emit(name, event)
+
+    def _retry_pause(self, reason: str, attempt: int):
+        """Учет повтора и пауза перед ним"""
+        self.retry_stats.record_retry(reason)
+        sleep(self.retry_policy.backoff(attempt))
+
+    def _throttle(self):
+        """Ожидание очереди в ограничителе частоты запросов"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def _rate_limit_delay(self, response, attempt: int) -> float:
+        """Пауза после 429: из Retry-After, иначе экспоненциальная"""
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        return delay if delay is not None else self.rate_limit_backoff * 2 ** attempt
+
+    def _backoff_rate_limited(self, response, attempt: int):
+        """Пауза после 429; общий ограничитель притормаживает сразу все потоки"""
+        delay = self._rate_limit_delay(response, attempt)
+        if self.rate_limiter:
+            self.rate_limiter.penalize(delay)
+        else:
+            sleep(delay)
 
     def _handle_http_error(self, error: requests.HTTPError, response: requests.Response):
         """Обработка HTTP ошибок"""
@@ -400,15 +1019,72 @@ class ALFACRM:
                 response_data=error_data
             ) from error
 
+    def _token_valid(self) -> bool:
+        return bool(self.token) and datetime.now() < self.token_expires_at
+
+    def _token_expiring(self) -> bool:
+        return datetime.now() >= self.token_expires_at - timedelta(seconds=self.token_refresh_margin)
+
+    def _ensure_token(self) -> str:
+        """
+        Действующий токен. Истекший токен обновляет один поток, остальные ждут его результата;
+        за token_refresh_margin секунд до истечения токен обновляется в фоне
+        """
+        if self._token_valid():
+            if self._token_expiring():
+                self._schedule_token_refresh()
+            return self.token
+
+        with self._auth_lock:
+            if not self._token_valid() and not self._load_cached_token():
+                self.authenticate()
+            return self.token
+
+    def _load_cached_token(self) -> bool:
+        """Токен из файлового кэша, если он еще действует"""
+        cached = self.token_cache.load(self.hostname, self.email) if self.token_cache else None
+        if not cached:
+            return False
+        self.token, self.token_expires_at = cached
+        return True
+
+    def _refresh_token(self, stale_token: str) -> str:
+        """Замена токена stale_token на новый; если другой поток уже обновил токен, повторного входа нет"""
+        with self._auth_lock:
+            if self.token == stale_token:
+                if self.token_cache:
+                    self.token_cache.invalidate(self.hostname, self.email, stale_token)
+                self.authenticate()
+            return self.token
+
+    def _schedule_token_refresh(self):
+        """Фоновое обновление токена, не более одного одновременно"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        stale_token = self.token
+
+        def refresh():
+            try:
+                self._refresh_token(stale_token)
+            except APIClientError:
+                # Не страшно: после истечения токен будет обновлен синхронно
+                pass
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, name='alfacrm-token-refresh', daemon=True).start()
+
     def authenticate(self):
         """Аутентификация и получение нового токена"""
         url = f"https://{self.hostname}/v2api/auth/login"
 
+        self._throttle()
+        self._reaper.touch()
         try:
-            response = requests.post(url, json={
+            response = self.session.post(url, json={
                 "email": self.email,
                 "api_key": self.api_key
-            })
+            }, timeout=self.timeout)
             response.raise_for_status()
 
             auth_data = response.json()
@@ -418,10 +1094,46 @@ class ALFACRM:
 
             # Токен действителен 3600 секунд (1 час)
             self.token_expires_at = datetime.now() + timedelta(seconds=3500)
+            if self.token_cache:
+                self.token_cache.store(self.hostname, self.email, self.token, self.token_expires_at)
 
         except requests.HTTPError as e:
             raise AuthenticationError(f"Authentication failed: {e.response.text}") from e
+        except ValueError as e:
+            raise AuthenticationError(f"Authentication failed: invalid JSON in response: {e}") from e
+        except requests.RequestException as e:
+            raise APIConnectionError(f"Authentication failed: {e}") from e
+
+    def _after_write(self, entity: 'ALFACRM.Entity'):
+        """Сброс кэшей, которые могли устареть после записи через клиент"""
+        if self.reference is not None:
+            self.reference.invalidate_entity(entity.entity_name, entity._current_branch())
+        if self.response_cache is not None:
+            self.response_cache.invalidate(entity.entity_name, entity._cache_branch(), self.hostname)
+
+    def _branch_ids(self) -> List[int]:
+        """id всех филиалов (через кэш справочников, если он есть)"""
+        branches = self.reference.get('branch') if self.reference is not None else self.branch.iter_items()
+        return [branch['id'] for branch in branches]
+
+    def flush(self):
+        """Немедленная отправка отложенных update"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    @contextmanager
+    def branch_scope(self, branch_id: int):
+        """
+        Филиал для запросов внутри блока в текущем потоке или asyncio-задаче:
+        with client.branch_scope(3): client.customer.index(). В отличие от set_branch
+        не меняет общее состояние, поэтому один клиент можно использовать из многих потоков
+        """
+        token = self._branch_scope.set(branch_id)
+        try:
+            yield self
+        finally:
+            self._branch_scope.reset(token)
 
     def set_branch(self, branch_id: int):
-        """Установка активного филиала"""
+        """Установка филиала по умолчанию для всех потоков (см. также branch_scope)"""
         self.branch_id = branch_id
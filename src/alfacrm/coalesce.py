@@ -0,0 +1,128 @@
+# coalesce.py
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+
+class _Pending:
+    __slots__ = ('entity', 'entity_id', 'data', 'future', 'deadline')
+
+    def __init__(self, entity, entity_id: int, data: Dict, deadline: float):
+        self.entity = entity
+        self.entity_id = entity_id
+        self.data = data
+        self.future = Future()
+        self.deadline = deadline
+
+
+class WriteBuffer:
+    """
+    Буфер отложенных update: изменения одной записи за окно window секунд объединяются
+    (более поздние значения полей побеждают) и уходят одним запросом.
+    Все вызовы update, попавшие в один запрос, получают общий Future с его результатом
+    """
+
+    def __init__(self, client, window: float = 0.5):
+        self.client = client
+        self.window = window
+        self.merged = 0
+        self.sent = 0
+        self._pending: Dict[Tuple, _Pending] = {}
+        self._condition = threading.Condition()
+        # Отправки идут по одной: иначе flush() и фоновый поток могли бы отправить изменения
+        # одной записи одновременно, и более старые значения оказались бы последними
+        self._send_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @staticmethod
+    def _key(entity, entity_id: int) -> Tuple:
+        branch_id = entity._current_branch() if entity.branch_required else None
+        return entity.entity_name, branch_id, entity_id
+
+    def pending(self, entity, entity_id: int) -> Dict:
+        """Еще не отправленные изменения записи"""
+        with self._condition:
+            pending = self._pending.get(self._key(entity, entity_id))
+            return dict(pending.data) if pending is not None else {}
+
+    def submit(self, entity, entity_id: int, data: Dict) -> Future:
+        """Постановка проверенных данных update в очередь"""
+        key = self._key(entity, entity_id)
+        branch_id = key[1]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("WriteBuffer закрыт")
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.data.update(data)
+                self.merged += 1
+                return pending.future
+
+            # Филиал фиксируется при постановке: отправка идет из другого потока
+            scoped = entity.for_branch(branch_id) if branch_id is not None else entity
+            pending = self._pending[key] = _Pending(scoped, entity_id, dict(data), time.monotonic() + self.window)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='alfacrm-write-buffer', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return pending.future
+
+    def _take(self, due_only: bool) -> List[_Pending]:
+        now = time.monotonic()
+        batch = []
+        # Записи упорядочены по времени постановки, а значит и по сроку отправки
+        for key, pending in list(self._pending.items()):
+            if due_only and pending.deadline > now:
+                break
+            batch.append(self._pending.pop(key))
+        return batch
+
+    def _timeout(self):
+        if not self._pending:
+            return None
+        return max(0.0, next(iter(self._pending.values())).deadline - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and self._timeout() != 0.0:
+                    self._condition.wait(self._timeout())
+                if self._closed:
+                    return
+            with self._send_lock:
+                with self._condition:
+                    batch = self._take(due_only=True)
+                self._send(batch)
+
+    def _send(self, batch: List[_Pending]):
+        def send(pending: _Pending):
+            try:
+                pending.future.set_result(pending.entity._send_update(pending.entity_id, pending.data))
+            except Exception as e:
+                pending.future.set_exception(e)
+
+        if batch:
+            with self._condition:
+                self.sent += len(batch)
+            self.client._map_concurrent(send, batch)
+
+    def flush(self):
+        """Немедленная отправка всех накопленных изменений"""
+        with self._send_lock:
+            with self._condition:
+                batch = self._take(due_only=False)
+            self._send(batch)
+
+    def close(self):
+        """Отправка накопленных изменений и остановка фонового потока"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,53 @@
+# codec.py
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Сериализация типов, которые не поддерживает JSON"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json', exclude_none=True)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JSONCodec:
+    """Кодек на стандартном модуле json"""
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """Быстрый кодек на orjson (pip install orjson)"""
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec требует orjson: pip install alfacrm[fast]")
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+def default_codec():
+    """orjson, если установлен, иначе стандартный json"""
+    return OrjsonCodec() if orjson is not None else JSONCodec()
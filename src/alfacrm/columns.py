@@ -0,0 +1,252 @@
+# columns.py
+import math
+import typing
+from array import array
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Type
+from .models import ALFABaseModel
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy ставится через extra [columns]
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover - pyarrow ставится через extra [arrow]
+    pyarrow = None
+
+_EPOCH = date(1970, 1, 1).toordinal()
+_NAT = -2 ** 63  # NaT в datetime64[D]
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    """Дата из date/datetime или строки YYYY-MM-DD / DD.MM.YYYY (время отбрасывается)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        if len(value) >= 10 and value[4] == '-':
+            return date.fromisoformat(value[:10])
+        if len(value) >= 10 and value[2] == '.':
+            return datetime.strptime(value[:10], '%d.%m.%Y').date()
+    raise ValueError(f"Не удалось разобрать дату: {value!r}")
+
+
+def _annotation_kind(annotation: Any) -> Optional[str]:
+    """Тип колонки по аннотации поля модели"""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _annotation_kind(args[0]) if len(args) == 1 else None
+    if origin is typing.Literal:
+        args = typing.get_args(annotation)
+        return _annotation_kind(type(args[0])) if args and len({type(arg) for arg in args}) == 1 else None
+    if annotation is bool:
+        return 'bool'
+    if annotation is int:
+        return 'int'
+    if annotation is float:
+        return 'float'
+    if annotation is date:
+        return 'date'
+    return None
+
+
+def _value_kind(value: Any) -> str:
+    """Тип колонки по первому значению, если модель его не задает"""
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, date):
+        return 'date'
+    return 'object'
+
+
+class ColumnBuffer:
+    """
+    Буфер одной колонки: числа и даты копятся в array.array (без Python-объекта на значение),
+    пропуски отмечаются в маске. Значение, не подходящее под тип, переводит колонку в object
+    """
+
+    _typecodes = {'float': 'd', 'int': 'q', 'bool': 'b', 'date': 'q'}
+
+    def __init__(self, kind: str, length: int = 0):
+        self.kind = kind
+        self.values = array(self._typecodes[kind]) if kind in self._typecodes else []
+        self.mask = bytearray()
+        self.missing = 0
+        for _ in range(length):
+            self.append(None)
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    def append(self, value: Any):
+        if value is None or value == '':
+            self.values.append(None if self.kind == 'object' else (_NAT if self.kind == 'date' else 0))
+            self.mask.append(1)
+            self.missing += 1
+            return
+
+        try:
+            converted = self._convert(value)
+        except (TypeError, ValueError, OverflowError):
+            self._promote_to_object()
+            converted = value
+        self.values.append(converted)
+        self.mask.append(0)
+
+    def _convert(self, value: Any) -> Any:
+        kind = self.kind
+        if kind == 'float':
+            return float(value)
+        if kind == 'int':
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(value)
+            return int(value)
+        if kind == 'bool':
+            return 1 if value in (True, 1, '1', 'true', 'True') else 0
+        if kind == 'date':
+            return _parse_date(value).toordinal() - _EPOCH
+        return value
+
+    def _python_values(self) -> List:
+        """Значения буфера как объекты Python (None для пропусков)"""
+        result = []
+        for value, missing in zip(self.values, self.mask):
+            if missing:
+                result.append(None)
+            elif self.kind == 'date':
+                result.append(date.fromordinal(value + _EPOCH))
+            elif self.kind == 'bool':
+                result.append(bool(value))
+            else:
+                result.append(value)
+        return result
+
+    def _promote_to_object(self):
+        if self.kind != 'object':
+            self.values = self._python_values()
+            self.kind = 'object'
+
+    def to_numpy(self):
+        """
+        numpy-массив: float64, int64, bool, datetime64[D] или object.
+        Целые и логические колонки с пропусками становятся float64 с NaN
+        """
+        if self.kind == 'object':
+            result = numpy.empty(len(self.values), dtype=object)
+            result[:] = self.values
+            return result
+        if self.kind == 'date':
+            return numpy.frombuffer(self.values, dtype='int64').view('datetime64[D]').copy()
+
+        result = numpy.frombuffer(self.values, dtype={'float': 'float64', 'int': 'int64', 'bool': 'int8'}[self.kind])
+        if self.kind == 'float':
+            result = result.copy()
+            if self.missing:
+                result[numpy.frombuffer(self.mask, dtype=bool)] = math.nan
+            return result
+        if self.missing:
+            result = result.astype('float64')
+            result[numpy.frombuffer(self.mask, dtype=bool)] = math.nan
+            return result
+        return result.astype(bool) if self.kind == 'bool' else result.copy()
+
+    def to_arrow(self):
+        """pyarrow-массив с null вместо пропусков"""
+        mask = numpy.frombuffer(self.mask, dtype=bool) if self.missing else None
+        if self.kind == 'object':
+            return pyarrow.array(self.values, from_pandas=True)
+        if self.kind == 'date':
+            days = numpy.frombuffer(self.values, dtype='int64').astype('int32')
+            return pyarrow.array(days, type=pyarrow.date32(), mask=mask)
+        dtype = {'float': 'float64', 'int': 'int64', 'bool': 'int8'}[self.kind]
+        data = numpy.frombuffer(self.values, dtype=dtype)
+        if self.kind == 'bool':
+            data = data.astype(bool)
+        return pyarrow.array(data, mask=mask)
+
+
+class ColumnBuilder:
+    """
+    Построчное заполнение колонок из страниц ответа API.
+    Типы берутся из модели ответа; поля *_date и dob приводятся к датам (YYYY-MM-DD и DD.MM.YYYY)
+    """
+
+    def __init__(
+            self,
+            model: Optional[Type[ALFABaseModel]] = None,
+            fields: Optional[Iterable[str]] = None,
+            date_fields: Optional[Iterable[str]] = None
+    ):
+        self.model = model
+        self.fields = list(fields) if fields is not None else None
+        self.date_fields = set(date_fields) if date_fields is not None else None
+        self.columns: Dict[str, ColumnBuffer] = {}
+        self.rows = 0
+        for name in self.fields or ():
+            self.columns[name] = None
+
+    def _kind(self, name: str, value: Any) -> str:
+        if self.date_fields is not None:
+            if name in self.date_fields:
+                return 'date'
+        elif name.endswith('_date') or name == 'dob':
+            return 'date'
+
+        field = self.model.model_fields.get(name) if self.model else None
+        kind = _annotation_kind(field.annotation) if field else None
+        return kind or _value_kind(value)
+
+    def add_items(self, items: Iterable[Dict]):
+        """Добавление записей одной страницы"""
+        columns = self.columns
+        fixed = self.fields is not None
+        for item in items:
+            for name, value in item.items():
+                if fixed and name not in columns:
+                    continue
+                buffer = columns.get(name)
+                if buffer is None:
+                    if value is None:
+                        # Тип колонки определится по первому непустому значению
+                        continue
+                    buffer = columns[name] = ColumnBuffer(self._kind(name, value), length=self.rows)
+                buffer.append(value)
+
+            self.rows += 1
+            for buffer in columns.values():
+                if buffer is not None and len(buffer) < self.rows:
+                    buffer.append(None)
+
+    def _buffers(self) -> Dict[str, ColumnBuffer]:
+        return {
+            name: buffer if buffer is not None else ColumnBuffer('object', length=self.rows)
+            for name, buffer in self.columns.items()
+        }
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Словарь колонка -> numpy-массив"""
+        require_numpy()
+        return {name: buffer.to_numpy() for name, buffer in self._buffers().items()}
+
+    def to_arrow(self):
+        """pyarrow.Table"""
+        require_arrow()
+        return pyarrow.table({name: buffer.to_arrow() for name, buffer in self._buffers().items()})
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("Для выгрузки в колонки требуется numpy: pip install alfacrm[columns]")
+
+
+def require_arrow():
+    if pyarrow is None or numpy is None:
+        raise ImportError("Для выгрузки в Arrow требуются pyarrow и numpy: pip install alfacrm[arrow]")
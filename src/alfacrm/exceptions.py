@@ -28,7 +28,7 @@ class RateLimitExceeded(APIClientError):
 
 class APIRequestError(APIClientError):
     """Общая ошибка API запроса"""
-    def __init__(self, message: str, status_code: int, response_data: dict = None):
+    def __init__(self, message: str, status_code: int = None, response_data: dict = None):
         super().__init__(message)
         self.status_code = status_code
         self.response_data = response_data or {}
@@ -48,3 +48,9 @@ class APIConnectionError(APIClientError):
     """Ошибка соединения с API"""
     def __init__(self, message: str = "Connection error"):
         super().__init__(message)
+
+class ResponseValidationError(APIClientError):
+    """Ответ API не соответствует модели"""
+    def __init__(self, errors: list, message: str = "Response validation error"):
+        super().__init__(message)
+        self.errors = errors
@@ -0,0 +1,126 @@
+# hooks.py
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+# События жизненного цикла запроса:
+# - before_request - перед каждой попыткой отправки
+# - after_response - получен HTTP-ответ (в том числе тот, что будет повторен)
+# - on_retry - попытка будет повторена (reason: HTTP 429, HTTP 503, ConnectTimeout...)
+# - on_error - запрос завершился ошибкой
+HOOK_EVENTS = ('before_request', 'after_response', 'on_retry', 'on_error')
+
+
+class RequestEvent:
+    """
+    Данные одной попытки запроса. Время в секундах:
+    elapsed - всего, connect - установка соединения, wait - от отправки до заголовков ответа,
+    download - чтение тела ответа. Недоступные транспорту значения остаются None
+    """
+    __slots__ = (
+        'method', 'url', 'entity', 'action', 'branch_id', 'page', 'attempt',
+        'status_code', 'bytes_sent', 'bytes_received',
+        'elapsed', 'connect', 'wait', 'download', 'reason', 'error'
+    )
+
+    def __init__(
+            self,
+            method: str,
+            url: str,
+            entity: Optional[str] = None,
+            action: Optional[str] = None,
+            branch_id: Optional[int] = None,
+            page: Optional[int] = None,
+            attempt: int = 0,
+            bytes_sent: int = 0
+    ):
+        self.method = method
+        self.url = url
+        self.entity = entity
+        self.action = action
+        self.branch_id = branch_id
+        self.page = page
+        self.attempt = attempt
+        self.bytes_sent = bytes_sent
+        self.status_code: Optional[int] = None
+        self.bytes_received: Optional[int] = None
+        self.elapsed: Optional[float] = None
+        self.connect: Optional[float] = None
+        self.wait: Optional[float] = None
+        self.download: Optional[float] = None
+        self.reason: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (
+            f"RequestEvent({self.method} {self.entity}/{self.action} branch={self.branch_id} page={self.page} "
+            f"status={self.status_code} elapsed={self.elapsed})"
+        )
+
+
+class RequestHooks:
+    """
+    Обработчики событий запросов клиента:
+    client.hooks.add('after_response', lambda event: print(event.entity, event.elapsed))
+    или декоратором @client.hooks.on('on_retry')
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callable[[RequestEvent], Any]]] = {name: [] for name in HOOK_EVENTS}
+
+    def __bool__(self) -> bool:
+        return any(self._callbacks.values())
+
+    def _check(self, name: str):
+        if name not in self._callbacks:
+            raise ValueError(f"Неизвестное событие {name}, доступны: {', '.join(HOOK_EVENTS)}")
+
+    def add(self, name: str, callback: Callable[[RequestEvent], Any]) -> Callable[[RequestEvent], Any]:
+        self._check(name)
+        self._callbacks[name].append(callback)
+        return callback
+
+    def on(self, name: str) -> Callable:
+        """Регистрация обработчика декоратором"""
+        self._check(name)
+        return lambda callback: self.add(name, callback)
+
+    def remove(self, name: str, callback: Callable[[RequestEvent], Any]):
+        self._check(name)
+        self._callbacks[name].remove(callback)
+
+    def emit(self, name: str, event: RequestEvent):
+        for callback in self._callbacks[name]:
+            callback(event)
+
+
+class HttpxTrace:
+    """
+    Обработчик расширения trace в httpx: отметки времени этапов запроса
+    (соединение, отправка, заголовки ответа), из которых считаются connect / wait / download
+    """
+    __slots__ = ('marks',)
+
+    def __init__(self):
+        self.marks: Dict[str, float] = {}
+
+    async def __call__(self, name: str, info: Dict):
+        # connection.connect_tcp.started, http11.receive_response_headers.complete... без префикса
+        self.marks[name.split('.', 1)[-1]] = perf_counter()
+
+    def timings(self, finished: float) -> Dict[str, Optional[float]]:
+        marks = self.marks
+        connect = wait = download = None
+        if 'connect_tcp.started' in marks:
+            connected = marks.get('start_tls.complete', marks.get('connect_tcp.complete'))
+            if connected is not None:
+                connect = connected - marks['connect_tcp.started']
+        headers = marks.get('receive_response_headers.complete')
+        if headers is not None:
+            sent = marks.get('send_request_body.complete', marks.get('send_request_headers.complete'))
+            if sent is not None:
+                wait = headers - sent
+            download = finished - headers
+        return {'connect': connect, 'wait': wait, 'download': download}
@@ -0,0 +1,171 @@
+# lookup.py
+import re
+import threading
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set
+from .columns import _parse_date
+
+# Поля клиента, по которым строятся индексы
+INDEXED_FIELDS = ('phone', 'email', 'legal_name')
+
+
+def normalize_phone(value: Any, digits: int = 10) -> Optional[str]:
+    """Последние digits цифр номера: +7 (999) 123-45-67, 89991234567 и 9991234567 совпадают"""
+    number = re.sub(r'\D', '', str(value or ''))
+    return number[-digits:] if number else None
+
+
+def normalize_email(value: Any) -> Optional[str]:
+    email = str(value or '').strip().lower()
+    return email or None
+
+
+def normalize_name(value: Any) -> Optional[str]:
+    name = ' '.join(str(value or '').split()).casefold()
+    return name or None
+
+
+def _as_list(value: Any) -> List:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class CustomerIndex:
+    """
+    Локальные индексы клиентов по телефону, email и legal_name: поиск id без запроса к API.
+    refresh() загружает клиентов филиала, повторные вызовы догружают только измененных
+    (updated_at_from). Записи через клиент и события ChangeFeed обновляют индекс через
+    add / update / remove и attach(feed)
+    """
+
+    def __init__(self, client=None, branch_id: int = None, phone_digits: int = 10):
+        self.client = client
+        self.branch_id = branch_id
+        self.phone_digits = phone_digits
+        self.high_water: Optional[date] = None
+        self._phone: Dict[str, Set[int]] = {}
+        self._email: Dict[str, Set[int]] = {}
+        self._legal_name: Dict[str, Set[int]] = {}
+        # Проиндексированные значения полей по id, нужны для удаления старых ключей
+        self._fields: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __contains__(self, customer_id: int) -> bool:
+        return customer_id in self._fields
+
+    def _keys(self, fields: Dict[str, Any]):
+        for phone in _as_list(fields.get('phone')):
+            yield self._phone, normalize_phone(phone, self.phone_digits)
+        for email in _as_list(fields.get('email')):
+            yield self._email, normalize_email(email)
+        yield self._legal_name, normalize_name(fields.get('legal_name'))
+
+    def _unlink(self, customer_id: int):
+        fields = self._fields.pop(customer_id, None)
+        if fields is None:
+            return
+        for index, key in self._keys(fields):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(customer_id)
+                if not ids:
+                    del index[key]
+
+    def _link(self, customer_id: int, fields: Dict[str, Any]):
+        self._fields[customer_id] = fields
+        for index, key in self._keys(fields):
+            if key:
+                index.setdefault(key, set()).add(customer_id)
+
+    def add(self, customer: Any):
+        """Добавление или замена клиента (словарь из ответа API или модель)"""
+        customer = customer if isinstance(customer, dict) else customer.model_dump()
+        fields = {name: customer.get(name) for name in INDEXED_FIELDS}
+        with self._lock:
+            self._unlink(customer['id'])
+            self._link(customer['id'], fields)
+
+    def update(self, customer_id: int, **fields):
+        """Изменение части полей клиента (остальные проиндексированные значения сохраняются)"""
+        with self._lock:
+            merged = {**self._fields.get(customer_id, {}), **{
+                name: value for name, value in fields.items() if name in INDEXED_FIELDS
+            }}
+            self._unlink(customer_id)
+            self._link(customer_id, merged)
+
+    def remove(self, customer_id: int):
+        with self._lock:
+            self._unlink(customer_id)
+
+    def load(self, customers: Iterable[Any]) -> int:
+        """Добавление клиентов из выгрузки; возвращает их число"""
+        count = 0
+        for customer in customers:
+            if not isinstance(customer, dict):
+                customer = customer.model_dump()
+            self.add(customer)
+            try:
+                updated_at = _parse_date(customer.get('updated_at'))
+            except ValueError:
+                updated_at = None
+            if updated_at and (self.high_water is None or updated_at > self.high_water):
+                self.high_water = updated_at
+            count += 1
+        return count
+
+    def refresh(self, full: bool = False, **params) -> int:
+        """Загрузка клиентов через API; без full - только измененные с прошлой загрузки"""
+        customer = self.client.customer
+        if self.branch_id is not None:
+            customer = customer.for_branch(self.branch_id)
+        if full:
+            with self._lock:
+                self._phone.clear()
+                self._email.clear()
+                self._legal_name.clear()
+                self._fields.clear()
+            self.high_water = None
+        if self.high_water is not None:
+            params['updated_at_from'] = self.high_water.strftime('%d.%m.%Y')
+        return self.load(customer.iter_items(**params))
+
+    def attach(self, feed):
+        """Обновление индекса по событиям ChangeFeed"""
+        def apply(event):
+            if event.entity != 'customer' or event.entity_id is None:
+                return
+            if event.action == 'delete':
+                self.remove(event.entity_id)
+            elif set(event.new) & set(INDEXED_FIELDS):
+                self.update(event.entity_id, **event.new)
+        return feed.subscribe(apply)
+
+    def _lookup(self, index: Dict[str, Set[int]], key: Optional[str]) -> List[int]:
+        with self._lock:
+            return sorted(index.get(key, ()))
+
+    def by_phone(self, phone: Any) -> List[int]:
+        """id клиентов с этим телефоном"""
+        return self._lookup(self._phone, normalize_phone(phone, self.phone_digits))
+
+    def by_email(self, email: Any) -> List[int]:
+        return self._lookup(self._email, normalize_email(email))
+
+    def by_legal_name(self, legal_name: Any) -> List[int]:
+        return self._lookup(self._legal_name, normalize_name(legal_name))
+
+    def match(self, phone: Any = None, email: Any = None, legal_name: Any = None) -> List[int]:
+        """id клиентов, совпавших хотя бы по одному из переданных значений"""
+        ids = set()
+        if phone:
+            ids.update(self.by_phone(phone))
+        if email:
+            ids.update(self.by_email(email))
+        if legal_name:
+            ids.update(self.by_legal_name(legal_name))
+        return sorted(ids)
@@ -0,0 +1,68 @@
+# ratelimit.py
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket для исходящих запросов:
+    - rate - сколько запросов в секунду пропускать в среднем
+    - burst - сколько запросов можно отправить подряд без ожидания
+    Один экземпляр можно разделить между несколькими клиентами и потоками
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть больше 0")
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Резервирует токен и возвращает, сколько секунд нужно подождать перед запросом"""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+            # Токены могут уйти в минус: так очередь ожидающих выстраивается равномерно
+            self._tokens -= 1
+            return max(0.0, self._updated - now) + max(0.0, -self._tokens) / self.rate
+
+    def acquire(self):
+        """Блокирующее ожидание своей очереди"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def penalize(self, delay: float):
+        """Пауза для всех запросов после ответа 429: пополнение начнется только через delay секунд"""
+        with self._lock:
+            resume_at = time.monotonic() + delay
+            if resume_at > self._updated:
+                self._updated = resume_at
+                self._tokens = min(self._tokens, 1.0)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбор заголовка Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
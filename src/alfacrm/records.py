@@ -0,0 +1,271 @@
+# records.py
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Annotated, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+from pydantic import AfterValidator, BeforeValidator, ConfigDict, PlainValidator, TypeAdapter, ValidationError, WrapValidator
+from pydantic.fields import FieldInfo
+from . import models
+from .exceptions import ResponseValidationError
+from .models import ALFABaseModel
+
+# Форматы записей в результатах index/iter_*:
+# - dict - исходные словари из ответа API
+# - model - экземпляры *Response моделей, проверенные пачкой на всю страницу
+# - lazy - LazyRecord: поле проверяется только при первом обращении
+# - compact - RecordTable: строки-кортежи с общей схемой ключей
+RECORD_FORMATS = ('dict', 'model', 'lazy', 'compact')
+
+# Суффикс имени варианта модели для разбора ответов (CustomerResponseLenient)
+LENIENT_SUFFIX = 'Lenient'
+
+# Режимы @field_validator и соответствующие им валидаторы для Annotated
+_FIELD_VALIDATORS = {
+    'before': BeforeValidator,
+    'after': AfterValidator,
+    'wrap': WrapValidator,
+    'plain': PlainValidator
+}
+
+
+@lru_cache(maxsize=None)
+def response_model(model: Type[ALFABaseModel]) -> Type[ALFABaseModel]:
+    """
+    Вариант модели для разбора ответов: API возвращает больше полей, чем описано в моделях,
+    поэтому лишние поля игнорируются, а не вызывают ошибку (extra='forbid' в ALFABaseModel).
+    Класс доступен как alfacrm.records.<Модель>Lenient, поэтому записи можно передавать через pickle
+    """
+    name = model.__name__ + LENIENT_SUFFIX
+    lenient = globals()[name] = type(name, (model,), {
+        '__module__': __name__,
+        '__qualname__': name,
+        '__doc__': model.__doc__,
+        'model_config': ConfigDict(extra='ignore')
+    })
+    return lenient
+
+
+def __getattr__(name: str):
+    # Вариант модели еще не создан в этом процессе (например, при разборе pickle в другом процессе)
+    if name.endswith(LENIENT_SUFFIX):
+        model = getattr(models, name[:-len(LENIENT_SUFFIX)], None)
+        if isinstance(model, type) and issubclass(model, ALFABaseModel):
+            return response_model(model)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=None)
+def items_adapter(model: Type[ALFABaseModel]) -> TypeAdapter:
+    """TypeAdapter для списка записей; строится один раз на модель"""
+    return TypeAdapter(List[response_model(model)])
+
+
+def validate_items(model: Type[ALFABaseModel], items: List[Dict]) -> List[ALFABaseModel]:
+    """Проверка всей страницы одним вызовом pydantic-core вместо создания моделей по одной"""
+    try:
+        return items_adapter(model).validate_python(items)
+    except ValidationError as e:
+        raise ResponseValidationError(e.errors()) from e
+
+
+@lru_cache(maxsize=None)
+def field_adapter(model: Type[ALFABaseModel], name: str) -> Optional[Tuple[str, TypeAdapter, FieldInfo]]:
+    """
+    Ключ в ответе API, TypeAdapter с ограничениями поля (ge, max_length...) и @field_validator модели
+    (в порядке объявления, как при полной проверке) и описание поля
+    """
+    field = model.model_fields.get(name)
+    if field is None:
+        return None
+    validators = [
+        _FIELD_VALIDATORS[decorator.info.mode](decorator.func)
+        for decorator in model.__pydantic_decorators__.field_validators.values()
+        if name in decorator.info.fields or '*' in decorator.info.fields
+    ]
+    metadata = [*field.metadata, *validators]
+    annotation = Annotated[(field.annotation, *metadata)] if metadata else field.annotation
+    return field.alias or name, TypeAdapter(annotation), field
+
+
+class LazyRecord:
+    """
+    Запись из ответа API с проверкой по требованию: поле приводится к типу модели
+    (даты, вложенные модели вроде LessonDetails) при первом обращении, результат кэшируется.
+    Проверяются тип, ограничения и валидаторы поля (@field_validator); валидаторы уровня модели
+    (@model_validator) и зависящие от других полей проверки не вызываются - для этого есть to_model()
+    """
+    __slots__ = ('_model', '_raw', '_cache')
+
+    def __init__(self, model: Type[ALFABaseModel], raw: Dict):
+        self._model = model
+        self._raw = raw
+        self._cache = {}
+
+    def __getattr__(self, name: str) -> Any:
+        # Служебные имена не являются полями: copy и pickle обращаются к ним до заполнения слотов
+        if name.startswith('_'):
+            raise AttributeError(name)
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+
+        spec = field_adapter(self._model, name)
+        if spec is None:
+            raise AttributeError(f"{self._model.__name__} has no field '{name}'")
+        key, adapter, field = spec
+
+        if key in self._raw:
+            try:
+                value = adapter.validate_python(self._raw[key])
+            except ValidationError as e:
+                raise ResponseValidationError([{**error, 'loc': (name, *error['loc'])} for error in e.errors()]) from e
+        elif field.is_required():
+            raise ResponseValidationError([{'type': 'missing', 'loc': (name,), 'msg': 'Field required'}])
+        else:
+            value = field.get_default(call_default_factory=True)
+
+        cache[name] = value
+        return value
+
+    def __getitem__(self, name: str) -> Any:
+        return self._raw[name]
+
+    def __dir__(self):
+        return list(self._model.model_fields)
+
+    def __repr__(self) -> str:
+        return f"LazyRecord[{self._model.__name__}]({self._raw!r})"
+
+    @property
+    def raw(self) -> Dict:
+        """Исходный словарь из ответа API"""
+        return self._raw
+
+    def to_model(self) -> ALFABaseModel:
+        """Полная проверка записи моделью"""
+        return validate_items(self._model, [self._raw])[0]
+
+
+_MISSING = object()
+
+
+class CompactRecord:
+    """Представление строки RecordTable; создается при обращении и не хранится в таблице"""
+    __slots__ = ('_table', '_values')
+
+    def __init__(self, table: 'RecordTable', values: tuple):
+        self._table = table
+        self._values = values
+
+    def get(self, key: str, default: Any = None) -> Any:
+        position = self._table._positions.get(key)
+        if position is None or position >= len(self._values):
+            return default
+        value = self._values[position]
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __getattr__(self, key: str) -> Any:
+        # Служебные имена не являются полями: copy и pickle обращаются к ним до заполнения атрибутов
+        if key.startswith('_'):
+            raise AttributeError(key)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise AttributeError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CompactRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CompactRecord({self.to_dict()!r})"
+
+    def keys(self) -> List[str]:
+        return [key for key, value in zip(self._table.columns, self._values) if value is not _MISSING]
+
+    def to_dict(self) -> Dict:
+        return {key: value for key, value in zip(self._table.columns, self._values) if value is not _MISSING}
+
+
+class RecordTable(Sequence):
+    """
+    Компактное хранилище записей для больших выгрузок:
+    - ключи хранятся один раз на таблицу, строка - кортеж значений в порядке columns
+    - повторяющиеся короткие строки (названия статусов, даты) хранятся в одном экземпляре
+    Схема расширяется, если в очередной записи встретился новый ключ
+    """
+
+    def __init__(self, items: Iterable[Dict] = (), intern_max_length: int = 32):
+        self.columns: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._rows: List[tuple] = []
+        self._strings: Dict[str, str] = {}
+        self.intern_max_length = intern_max_length
+        self.extend(items)
+
+    def _intern(self, value: Any) -> Any:
+        if type(value) is str and len(value) <= self.intern_max_length:
+            return self._strings.setdefault(value, value)
+        return value
+
+    def append(self, item: Dict):
+        """Добавление записи-словаря"""
+        positions = self._positions
+        for key in item:
+            if key not in positions:
+                positions[key] = len(self.columns)
+                self.columns.append(key)
+
+        if len(item) == len(self.columns) and all(positions[key] == i for i, key in enumerate(item)):
+            # Частый случай: ключи в том же порядке, что и схема
+            self._rows.append(tuple(self._intern(value) for value in item.values()))
+            return
+
+        row = [_MISSING] * len(self.columns)
+        for key, value in item.items():
+            row[positions[key]] = self._intern(value)
+        self._rows.append(tuple(row))
+
+    def extend(self, items: Iterable[Dict]):
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CompactRecord(self, values) for values in self._rows[index]]
+        return CompactRecord(self, self._rows[index])
+
+    def __iter__(self) -> Iterator[CompactRecord]:
+        for values in self._rows:
+            yield CompactRecord(self, values)
+
+    def __repr__(self) -> str:
+        return f"RecordTable(rows={len(self._rows)}, columns={self.columns!r})"
+
+    def column(self, key: str, default: Any = None) -> List:
+        """Значения одного поля по всем строкам"""
+        position = self._positions.get(key)
+        if position is None:
+            return [default] * len(self._rows)
+        return [
+            default if position >= len(values) or values[position] is _MISSING else values[position]
+            for values in self._rows
+        ]
+
+    def to_dicts(self) -> List[Dict]:
+        """Обратное преобразование в список словарей"""
+        return [record.to_dict() for record in self]
@@ -0,0 +1,145 @@
+# refcache.py
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .exceptions import APIClientError, MissingBranchError
+
+# Справочники: небольшие, меняются редко, нужны постоянно для расшифровки id в названия
+REFERENCE_ENTITIES = (
+    'branch', 'subject', 'room', 'location',
+    'lead_status', 'study_status', 'lead_source', 'lead_reject'
+)
+
+
+class _Entry:
+    __slots__ = ('items', 'by_id', 'loaded_at')
+
+    def __init__(self, items: List[Dict]):
+        self.items = items
+        self.by_id = {item['id']: item for item in items if 'id' in item}
+        self.loaded_at = time.monotonic()
+
+
+class ReferenceCache:
+    """
+    Кэш справочников по филиалам с TTL и stale-while-revalidate:
+    устаревшие данные отдаются сразу, а обновление идет в фоне (одно на справочник и филиал).
+    Блокирует только первая загрузка. Изменения справочника через клиент сбрасывают кэш
+    """
+
+    def __init__(self, client, ttl: float = 300.0, entities: Iterable[str] = REFERENCE_ENTITIES):
+        self.client = client
+        self.ttl = ttl
+        self.entities = tuple(entities)
+        # Имена сущностей в API: записи в другие сущности кэш не затрагивают
+        self._entity_names = {getattr(client, entity).entity_name for entity in self.entities}
+        self._entries: Dict[Tuple[str, Optional[int]], _Entry] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, Optional[int]], threading.Lock] = {}
+        self._refreshing = set()
+        # Счетчики сбросов по (сущность, филиал): загрузка, начатая до сброса,
+        # не должна вернуть в кэш старые данные
+        self._generations: Dict[Tuple[str, Optional[int]], int] = {}
+
+    def _entity(self, entity: str):
+        if entity not in self.entities:
+            raise ValueError(f"{entity} не входит в кэшируемые справочники")
+        return getattr(self.client, entity)
+
+    def _key(self, entity, branch_id: Optional[int]) -> Tuple[str, Optional[int]]:
+        if not entity.branch_required:
+            return entity.entity_name, None
+        branch_id = branch_id if branch_id is not None else entity._current_branch()
+        if not branch_id:
+            raise MissingBranchError("Branch ID is required for this entity")
+        return entity.entity_name, branch_id
+
+    def _fetch(self, entity, key: Tuple[str, Optional[int]]) -> _Entry:
+        with self._lock:
+            generation = self._generations.setdefault(key, 0)
+        scoped = entity.for_branch(key[1]) if key[1] is not None else entity
+        entry = _Entry(list(scoped.iter_items()))
+        with self._lock:
+            if generation == self._generations[key]:
+                self._entries[key] = entry
+        return entry
+
+    def _entry(self, entity: str, branch_id: Optional[int]) -> _Entry:
+        handler = self._entity(entity)
+        key = self._key(handler, branch_id)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            # Первая загрузка: остальные потоки ждут ее, а не запрашивают справочник повторно
+            with self._lock:
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+            with load_lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._fetch(handler, key)
+        elif time.monotonic() - entry.loaded_at > self.ttl:
+            self._refresh_in_background(handler, key)
+        return entry
+
+    def _refresh_in_background(self, entity, key: Tuple[str, Optional[int]]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(entity, key)
+            except APIClientError:
+                # Оставляем устаревшие данные, следующее обращение попробует снова
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='alfacrm-reference-refresh', daemon=True).start()
+
+    def get(self, entity: str, branch_id: int = None) -> List[Dict]:
+        """Все записи справочника (entity - имя атрибута клиента, например 'study_status')"""
+        return self._entry(entity, branch_id).items
+
+    def by_id(self, entity: str, branch_id: int = None) -> Dict[Any, Dict]:
+        """Записи справочника по id"""
+        return self._entry(entity, branch_id).by_id
+
+    def name(self, entity: str, entity_id: Any, branch_id: int = None, default: str = None) -> Optional[str]:
+        """Название записи справочника по id"""
+        item = self.by_id(entity, branch_id).get(entity_id)
+        return item.get('name', default) if item else default
+
+    def warm_up(self, branch_ids: Iterable[int] = None, entities: Iterable[str] = None):
+        """Параллельная предварительная загрузка справочников для филиалов"""
+        entities = tuple(entities or self.entities)
+        branch_ids = list(branch_ids) if branch_ids is not None else [None]
+        jobs = [
+            (entity, branch_id) for entity in entities for branch_id in branch_ids
+            if self._entity(entity).branch_required or branch_id is branch_ids[0]
+        ]
+        self.client._map_concurrent(lambda job: self._entry(*job), jobs)
+
+    def invalidate(self, entity: str = None, branch_id: int = None):
+        """Сброс кэша: всего, справочника или справочника в филиале"""
+        entity_name = self._entity(entity).entity_name if entity else None
+        self.invalidate_entity(entity_name, branch_id)
+
+    def invalidate_entity(self, entity_name: str = None, branch_id: int = None):
+        """Сброс по имени сущности в API (используется при записи через клиент)"""
+        if entity_name is not None and entity_name not in self._entity_names:
+            return
+
+        def matches(key: Tuple[str, Optional[int]]) -> bool:
+            return (entity_name is None or key[0] == entity_name) and (branch_id is None or key[1] in (branch_id, None))
+
+        with self._lock:
+            for key in self._generations:
+                if matches(key):
+                    self._generations[key] += 1
+            for key in list(self._entries):
+                if matches(key):
+                    del self._entries[key]
+
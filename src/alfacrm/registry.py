@@ -0,0 +1,152 @@
+# registry.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+import requests
+from .auth import TokenCache
+from .client import ALFACRM
+from .ratelimit import RateLimiter
+from .session import create_session, IdleConnectionReaper
+
+
+class ClientRegistry:
+    """
+    Клиенты для многих аккаунтов ALFA CRM (tenant - произвольный ключ) с общим пулом соединений,
+    общим ограничителем частоты и кэшем токенов. Клиент создается при первом обращении,
+    авторизуется при первом запросе и закрывается, если не использовался idle_timeout секунд
+    (или при превышении max_clients - самый давно использованный).
+    Соединения пула сбрасываются, если ни один клиент не обращался к API keepalive_expiry секунд
+    """
+
+    def __init__(
+            self,
+            session: Optional[requests.Session] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            token_cache: Optional[TokenCache] = None,
+            idle_timeout: Optional[float] = 600.0,
+            max_clients: Optional[int] = None,
+            pool_connections: int = 100,
+            pool_maxsize: int = 10,
+            keepalive_expiry: Optional[float] = None,
+            **client_kwargs
+    ):
+        # Пул общий для всех клиентов: по одному пулу на хост, клиенты его не закрывают
+        self._owns_session = session is None
+        self.session = session or create_session(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        # Простой учитывается по всем клиентам сразу: у каждого клиента был бы свой учет,
+        # и простаивающий аккаунт закрывал бы соединения остальных
+        self._reaper = IdleConnectionReaper(self.session, keepalive_expiry)
+        self.rate_limiter = rate_limiter
+        self.token_cache = token_cache
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.client_kwargs = client_kwargs
+        self._credentials: Dict[Any, Dict] = {}
+        self._clients: 'OrderedDict[Any, ALFACRM]' = OrderedDict()
+        self._last_used: Dict[Any, float] = {}
+        # Токены закрытых клиентов: повторное создание клиента не требует новой авторизации
+        self._tokens: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'ClientRegistry':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, tenant: Any) -> bool:
+        return tenant in self._credentials
+
+    def __len__(self) -> int:
+        return len(self._credentials)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._credentials))
+
+    def __getitem__(self, tenant: Any) -> ALFACRM:
+        return self.get(tenant)
+
+    def register(self, tenant: Any, hostname: str, email: str, api_key: str, **client_kwargs):
+        """Регистрация аккаунта; client_kwargs дополняют общие параметры клиентов"""
+        with self._lock:
+            self._credentials[tenant] = {'hostname': hostname, 'email': email, 'api_key': api_key, **client_kwargs}
+            stale = self._clients.pop(tenant, None)
+            self._last_used.pop(tenant, None)
+            self._tokens.pop(tenant, None)
+        if stale is not None:
+            stale.close()
+
+    def unregister(self, tenant: Any):
+        with self._lock:
+            self._credentials.pop(tenant, None)
+            client = self._clients.pop(tenant, None)
+            self._last_used.pop(tenant, None)
+            self._tokens.pop(tenant, None)
+        if client is not None:
+            client.close()
+
+    def get(self, tenant: Any) -> ALFACRM:
+        """Клиент аккаунта (создается при первом обращении)"""
+        with self._lock:
+            if tenant not in self._credentials:
+                raise KeyError(f"Аккаунт {tenant!r} не зарегистрирован")
+            client = self._clients.get(tenant)
+            if client is None:
+                client = self._clients[tenant] = self._create(self._credentials[tenant])
+                client.token, client.token_expires_at = self._tokens.pop(tenant, (None, None))
+            self._clients.move_to_end(tenant)
+            self._last_used[tenant] = time.monotonic()
+            evicted = self._take_evicted()
+        for stale in evicted:
+            stale.close()
+        return client
+
+    def _create(self, credentials: Dict) -> ALFACRM:
+        kwargs = {**self.client_kwargs, **credentials}
+        kwargs.setdefault('rate_limiter', self.rate_limiter)
+        kwargs.setdefault('token_cache', self.token_cache)
+        kwargs['keepalive_expiry'] = None
+        client = ALFACRM(session=self.session, **kwargs)
+        client._reaper = self._reaper
+        return client
+
+    def _take_evicted(self) -> list:
+        evicted = []
+        now = time.monotonic()
+        for tenant in list(self._clients):
+            over_limit = self.max_clients is not None and len(self._clients) > self.max_clients
+            idle = self.idle_timeout is not None and now - self._last_used[tenant] > self.idle_timeout
+            if not (over_limit or idle):
+                # Клиенты упорядочены по времени последнего обращения
+                break
+            client = self._clients.pop(tenant)
+            del self._last_used[tenant]
+            if client.token:
+                self._tokens[tenant] = (client.token, client.token_expires_at)
+            evicted.append(client)
+        return evicted
+
+    def evict_idle(self) -> int:
+        """Закрытие клиентов, простаивающих дольше idle_timeout; возвращает их число"""
+        with self._lock:
+            evicted = self._take_evicted()
+        for client in evicted:
+            client.close()
+        return len(evicted)
+
+    def active(self) -> list:
+        """Аккаунты, для которых сейчас есть клиент"""
+        with self._lock:
+            return list(self._clients)
+
+    def close(self):
+        """Закрытие всех клиентов и общего пула соединений"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._last_used.clear()
+        for client in clients:
+            client.close()
+        if self._owns_session:
+            self.session.close()
@@ -0,0 +1,208 @@
+# replica.py
+import json
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .columns import _parse_date
+from .exceptions import MissingBranchError
+
+# Сущности, фильтр которых поддерживает updated_at_from
+REPLICA_ENTITIES = ('customer', 'pay', 'group')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    entity TEXT NOT NULL,
+    branch_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    updated_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (entity, branch_id, id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    entity TEXT NOT NULL,
+    branch_id INTEGER NOT NULL,
+    high_water TEXT,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (entity, branch_id)
+);
+"""
+
+
+class SQLiteReplica:
+    """
+    Локальная копия сущностей по филиалам в SQLite.
+    Первая синхронизация выгружает все записи, следующие - только измененные начиная с
+    максимальной updated_at из прошлого запуска (фильтр API работает с точностью до дня,
+    поэтому день high-water mark запрашивается повторно, неизмененные строки не перезаписываются).
+    Удаление записей в CRM так не обнаруживается - для этого есть sync(full=True) и лента изменений.
+    Записи хранятся как JSON: SELECT json_extract(data, '$.name') FROM records WHERE entity = 'customer'
+    """
+
+    def __init__(self, client, path: str, entities: Iterable[str] = REPLICA_ENTITIES):
+        self.client = client
+        self.path = path
+        self.entities = tuple(entities)
+        for entity in self.entities:
+            self._entity(entity)
+        # Соединение используется из разных потоков, запись сериализуется блокировкой
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'SQLiteReplica':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _entity(self, entity: str):
+        handler = getattr(self.client, entity)
+        if not handler.filter_model or 'updated_at_from' not in handler.filter_model.model_fields:
+            raise ValueError(f"{entity} не поддерживает фильтр updated_at_from")
+        return handler
+
+    @staticmethod
+    def _branch_key(handler, branch_id: Optional[int]) -> int:
+        """Филиал в ключе таблицы; 0 для сущностей вне филиалов (NULL в первичном ключе не уникален)"""
+        if not handler.branch_required:
+            return 0
+        branch_id = branch_id if branch_id is not None else handler._current_branch()
+        if not branch_id:
+            raise MissingBranchError("Branch ID is required for this entity")
+        return branch_id
+
+    @staticmethod
+    def _updated_at(item: Dict) -> Optional[date]:
+        try:
+            return _parse_date(item.get('updated_at'))
+        except ValueError:
+            return None
+
+    def high_water(self, entity: str, branch_id: int = None) -> Optional[date]:
+        """Максимальная updated_at, полученная при прошлой синхронизации"""
+        handler = self._entity(entity)
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT high_water FROM sync_state WHERE entity = ? AND branch_id = ?',
+                (handler.entity_name, self._branch_key(handler, branch_id))
+            ).fetchone()
+        return date.fromisoformat(row['high_water']) if row and row['high_water'] else None
+
+    def sync_entity(self, entity: str, branch_id: int = None, full: bool = False, **params) -> int:
+        """
+        Синхронизация сущности в филиале; params - дополнительные параметры фильтра.
+        Возвращает число добавленных, измененных и удаленных записей
+        """
+        if full and params:
+            # Полная выгрузка удаляет записи, которых нет в ответе: с фильтром это были бы и существующие
+            raise ValueError("full=True нельзя сочетать с параметрами фильтра")
+        handler = self._entity(entity)
+        branch_key = self._branch_key(handler, branch_id)
+        if handler.branch_required:
+            handler = handler.for_branch(branch_key)
+
+        high_water = None if full else self.high_water(entity, branch_id)
+        if high_water is not None:
+            params['updated_at_from'] = high_water.strftime('%d.%m.%Y')
+
+        seen = set()
+        changed = 0
+        for response in handler.iter_pages(**params):
+            items = response.get('items', [])
+            changed += self.upsert(handler.entity_name, branch_key, items)
+            for item in items:
+                updated_at = self._updated_at(item)
+                if updated_at and (high_water is None or updated_at > high_water):
+                    high_water = updated_at
+                if full:
+                    seen.add(item.get('id'))
+
+        with self._lock, self.connection:
+            if full:
+                # Полная выгрузка: записи, которых больше нет в CRM, удаляются
+                stored = self.connection.execute(
+                    'SELECT id FROM records WHERE entity = ? AND branch_id = ?', (handler.entity_name, branch_key)
+                ).fetchall()
+                removed = [(handler.entity_name, branch_key, row['id']) for row in stored if row['id'] not in seen]
+                self.connection.executemany(
+                    'DELETE FROM records WHERE entity = ? AND branch_id = ? AND id = ?', removed
+                )
+                changed += len(removed)
+            self.connection.execute(
+                'INSERT INTO sync_state (entity, branch_id, high_water, synced_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (entity, branch_id) DO UPDATE SET high_water = excluded.high_water, '
+                'synced_at = excluded.synced_at',
+                (handler.entity_name, branch_key, high_water.isoformat() if high_water else None,
+                 datetime.now().isoformat())
+            )
+        return changed
+
+    def sync(self, entities: Iterable[str] = None, branch_ids: Iterable[int] = None, full: bool = False) -> Dict[Tuple[str, int], int]:
+        """Синхронизация сущностей во всех переданных филиалах; результат - число изменений по (сущность, филиал)"""
+        branch_ids = list(branch_ids) if branch_ids is not None else [None]
+        result = {}
+        for entity in entities or self.entities:
+            handler = self._entity(entity)
+            for branch_id in (branch_ids if handler.branch_required else [None]):
+                result[entity, self._branch_key(handler, branch_id)] = self.sync_entity(entity, branch_id, full=full)
+        return result
+
+    def upsert(self, entity_name: str, branch_id: int, items: Iterable[Dict]) -> int:
+        """Запись строк (entity_name - имя сущности в API); строки без изменений пропускаются"""
+        rows = [
+            (entity_name, branch_id or 0, item['id'], item.get('updated_at'),
+             json.dumps(item, ensure_ascii=False, sort_keys=True, default=str))
+            for item in items if item.get('id') is not None
+        ]
+        with self._lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT INTO records (entity, branch_id, id, updated_at, data) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (entity, branch_id, id) DO UPDATE SET updated_at = excluded.updated_at, '
+                'data = excluded.data WHERE records.data != excluded.data',
+                rows
+            )
+            return self.connection.total_changes - before
+
+    def patch(self, entity_name: str, branch_id: int, entity_id: Any, fields: Dict) -> int:
+        """Наложение значений полей на сохраненную строку (или создание строки)"""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT data FROM records WHERE entity = ? AND branch_id = ? AND id = ?',
+                (entity_name, branch_id or 0, entity_id)
+            ).fetchone()
+        item = json.loads(row['data']) if row else {}
+        item.update(fields)
+        item['id'] = entity_id
+        return self.upsert(entity_name, branch_id, [item])
+
+    def delete(self, entity_name: str, branch_id: int, ids: Iterable[Any]) -> int:
+        """Удаление строк по id"""
+        with self._lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'DELETE FROM records WHERE entity = ? AND branch_id = ? AND id = ?',
+                [(entity_name, branch_id or 0, entity_id) for entity_id in ids]
+            )
+            return self.connection.total_changes - before
+
+    def items(self, entity: str, branch_id: int = None) -> List[Dict]:
+        """Записи сущности из локальной копии"""
+        handler = self._entity(entity)
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT data FROM records WHERE entity = ? AND branch_id = ? ORDER BY id',
+                (handler.entity_name, self._branch_key(handler, branch_id))
+            ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def query(self, sql: str, parameters: Iterable = ()) -> List[sqlite3.Row]:
+        """Произвольный запрос к локальной копии"""
+        with self._lock:
+            return self.connection.execute(sql, tuple(parameters)).fetchall()
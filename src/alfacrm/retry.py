@@ -0,0 +1,82 @@
+# retry.py
+import random
+import threading
+from typing import Dict, Iterable
+
+
+class RetryPolicy:
+    """
+    Политика повторов при временных сбоях (обрывы соединения, таймауты, 5xx):
+    - max_attempts - общее число попыток, включая первую
+    - backoff_factor, backoff_max - экспоненциальная пауза factor * 2^n, но не больше max
+    - jitter - случайная пауза от 0 до расчетной, чтобы потоки не повторяли запросы синхронно
+    - idempotent_actions - действия, которые безопасно повторять при любом сбое.
+      Остальные (например, create) повторяются, только если запрос точно не дошел до сервера
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            backoff_factor: float = 0.5,
+            backoff_max: float = 30.0,
+            jitter: bool = True,
+            retry_statuses: Iterable[int] = (500, 502, 503, 504),
+            idempotent_actions: Iterable[str] = ('index', 'update')
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.idempotent_actions = frozenset(idempotent_actions)
+
+    def should_retry(self, action: str, attempt: int, safe: bool = False) -> bool:
+        """Можно ли повторить попытку номер attempt (с 0); safe - запрос не был отправлен"""
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return safe or action in self.idempotent_actions
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза перед повтором после попытки номер attempt"""
+        delay = min(self.backoff_max, self.backoff_factor * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class RetryStats:
+    """Потокобезопасные счетчики запросов и повторов клиента"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.by_reason: Dict[str, int] = {}
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_retry(self, reason: str):
+        with self._lock:
+            self.retries += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+    def record_rate_limited(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self) -> Dict:
+        """Копия текущих значений счетчиков"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'failures': self.failures,
+                'by_reason': dict(self.by_reason)
+            }
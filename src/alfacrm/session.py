@@ -0,0 +1,51 @@
+# session.py
+import time
+import threading
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_session(
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False
+) -> requests.Session:
+    """
+    Создание сессии с пулом keep-alive соединений:
+    - pool_connections - сколько хостов держать в пуле одновременно
+    - pool_maxsize - максимум соединений к одному хосту
+    - pool_block - ждать свободное соединение вместо открытия лишнего
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class IdleConnectionReaper:
+    """Закрывает соединения пула, простоявшие дольше keepalive_expiry секунд"""
+
+    def __init__(self, session: requests.Session, keepalive_expiry: Optional[float] = None):
+        self.session = session
+        self.keepalive_expiry = keepalive_expiry
+        self._last_used: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def touch(self):
+        """Отметка об использовании пула; сбрасывает его, если он простаивал"""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._last_used is not None and self.keepalive_expiry is not None \
+                and now - self._last_used > self.keepalive_expiry
+            self._last_used = now
+
+        if idle:
+            # Сервер, скорее всего, уже закрыл соединения - не пытаемся их переиспользовать
+            for adapter in self.session.adapters.values():
+                adapter.close()